@@ -0,0 +1,177 @@
+"""Benchmark the conversion hot paths on synthetic grids.
+
+Every case is timed on grids of each size and reports the best wall
+time of a few runs and the peak memory allocated during one run, as
+traced by tracemalloc (which includes numpy arrays). Save the results
+with --json and compare later runs with --compare to find regressions.
+
+    python benchmarks/benchmark.py --sizes 100 1000 --json baseline.json
+    python benchmarks/benchmark.py --sizes 100 1000 --compare baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+import matplotlib as mpl
+mpl.use('Agg')  # create plots without running X-server
+import matplotlib.pyplot as plt
+
+import geojsoncontour
+from geojsoncontour.utilities.multipoly import concatenate_rings, keep_high_angle, multi_polygon, orientation
+from geojsoncontour.utilities.multipoly import ring_metrics
+from geojsoncontour.utilities.vertices import get_vertices_from_path
+
+N_LEVELS = 10
+MIN_ANGLE_DEG = 10
+NDIGITS = 3
+
+
+def create_grid(size):
+    """Return lon, lat and a smooth field with many rings on a size x size grid."""
+    lon = numpy.linspace(-180, 180, size)
+    lat = numpy.linspace(-90, 90, size)
+    X, Y = numpy.meshgrid(lon, lat)
+    Z = numpy.sin(numpy.radians(X) * 6) * numpy.cos(numpy.radians(Y) * 8) + 0.5 * numpy.sin(numpy.radians(X * Y) / 8)
+    return lon, lat, Z
+
+
+def create_netcdf(dirname, size, n_timesteps=2):
+    import xarray
+    lon, lat, Z = create_grid(size)
+    data = numpy.stack([Z + 0.1 * t for t in range(n_timesteps)])
+    dataset = xarray.Dataset(
+        {'tas': (('time', 'lat', 'lon'), data, {'units': 'K'})},
+        coords={'time': numpy.arange(n_timesteps), 'lat': lat, 'lon': lon}
+    )
+    ncfile = os.path.join(dirname, 'benchmark.nc')
+    dataset.to_netcdf(ncfile)
+    return ncfile
+
+
+def cases(size, dirname):
+    """Return (name, function) of every benchmark on a grid of size."""
+    lon, lat, Z = create_grid(size)
+    levels = numpy.linspace(Z.min(), Z.max(), N_LEVELS)
+    figure = plt.figure()
+    ax = figure.add_subplot(111)
+    contour = ax.contour(lon, lat, Z, levels=levels, cmap=plt.cm.jet)
+    contourf = ax.contourf(lon, lat, Z, levels=levels, cmap=plt.cm.jet)
+    paths = contourf.get_paths()
+    rings = [ring for path in paths for ring in get_vertices_from_path(path)]
+    lines = [line for path in contour.get_paths() for line in get_vertices_from_path(path)]
+    benchmarks = [
+        ('get_vertices_from_path', lambda: [list(get_vertices_from_path(path)) for path in paths]),
+        ('orientation', lambda: [orientation(ring) for ring in rings if len(ring) > 3]),
+        ('ring_metrics', lambda: ring_metrics(*concatenate_rings(rings))),
+        ('multi_polygon', lambda: [multi_polygon(path, None, NDIGITS) for path in paths]),
+        ('keep_high_angle', lambda: [keep_high_angle(line, MIN_ANGLE_DEG) for line in lines]),
+        ('contour_to_geojson', lambda: geojsoncontour.contour_to_geojson(contour, ndigits=NDIGITS)),
+        ('contourf_to_geojson', lambda: geojsoncontour.contourf_to_geojson(contourf, ndigits=NDIGITS)),
+        ('contourf_to_geojson_overlap',
+         lambda: geojsoncontour.contourf_to_geojson_overlap(contourf, ndigits=NDIGITS)),
+        ('contourf_to_geojson min_angle_deg',
+         lambda: geojsoncontour.contourf_to_geojson(contourf, ndigits=NDIGITS, min_angle_deg=MIN_ANGLE_DEG)),
+        ('array_to_geojson', lambda: geojsoncontour.array_to_geojson(lon, lat, Z, levels, ndigits=NDIGITS)),
+    ]
+    serialize_modes = [
+        ('serialize=False', dict(serialize=False)),
+        ('serialize=fast', dict(serialize='fast')),
+        ('serialize=quantized', dict(serialize='quantized')),
+        ('output_format=geojsonseq', dict(serialize='fast', output_format='geojsonseq')),
+        ('output_format=ndjson', dict(serialize='fast', output_format='ndjson')),
+        ('output_format=topojson', dict(output_format='topojson')),
+    ]
+    for name, options in serialize_modes:
+        benchmarks.append((f'contourf_to_geojson {name}',
+                           lambda options=options: geojsoncontour.contourf_to_geojson(contourf, ndigits=NDIGITS,
+                                                                                      **options)))
+    geojson_filepath = os.path.join(dirname, 'benchmark.geojson')
+    benchmarks.append(('contourf_to_geojson file',
+                       lambda: geojsoncontour.contourf_to_geojson(contourf, geojson_filepath, ndigits=NDIGITS)))
+    try:
+        from geojsoncontour.utilities.netcdfhelper import netcdf_to_geojson
+        ncfile = create_netcdf(dirname, size)
+    except (ImportError, ValueError) as error:
+        print(f'Skipping netcdf_to_geojson: {error}', file=sys.stderr)
+    else:
+        benchmarks.append(('netcdf_to_geojson', lambda: netcdf_to_geojson(ncfile, 'tas')))
+    return benchmarks
+
+
+def measure(function, repeat):
+    """Return the best wall time of repeat runs and the peak traced memory of one run."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def run(sizes, repeat, selection=None):
+    results = {}
+    dirname = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            for name, function in cases(size, dirname):
+                if selection and not any(pattern in name for pattern in selection):
+                    continue
+                seconds, peak = measure(function, repeat)
+                results[f'{name} [{size}]'] = {'seconds': seconds, 'peak_bytes': peak}
+                print(f'{name + " [" + str(size) + "]":<55} {seconds:10.4f} s {peak / 2**20:10.1f} MiB', flush=True)
+            plt.close('all')
+    finally:
+        shutil.rmtree(dirname)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the cases that got more than threshold slower or larger, return their number."""
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ('seconds', 'peak_bytes'):
+            before, after = baseline[name][key], result[key]
+            if before and after > before * (1 + threshold):
+                print(f'REGRESSION {name} {key}: {before:.4g} -> {after:.4g} ({after / before - 1:+.0%})')
+                regressions += 1
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 1000],
+                        help='grid sizes, for example 100 1000 4000 8000')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per case')
+    parser.add_argument('-k', dest='selection', nargs='+', help='only run cases containing one of these names')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='compare with the results in this file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative change reported as regression')
+    args = parser.parse_args()
+    results = run(args.sizes, args.repeat, args.selection)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
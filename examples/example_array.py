@@ -0,0 +1,25 @@
+import numpy
+import geojsoncontour
+
+# Create lat and lon vectors and grid data
+grid_size = 1.0
+latrange = numpy.arange(-90.0, 90.0, grid_size)
+lonrange = numpy.arange(-180.0, 180.0, grid_size)
+X, Y = numpy.meshgrid(lonrange, latrange)
+Z = numpy.sqrt(X * X + Y * Y)
+
+n_contours = 20
+levels = numpy.linspace(start=0, stop=100, num=n_contours)
+
+# Contour the grid and convert to geojson, without creating a matplotlib figure
+geojson = geojsoncontour.array_to_geojson(
+    lonrange, latrange, Z, levels,
+    filled=True,
+    cmap='jet',
+    min_angle_deg=3.0,
+    ndigits=3,
+    stroke_width=2,
+    fill_opacity=0.5
+)
+
+print(geojson)
@@ -1,3 +1,15 @@
 from .contour import contour_to_geojson
 from .contour import contourf_to_geojson_overlap
 from .contour import contourf_to_geojson
+from .contour import array_to_geojson
+from .contour import batch_to_geojson
+from .contour import contour_to_tiles
+from .contour import contourf_to_tiles
+from .contour import iter_contour_features
+from .contour import iter_contourf_overlap_features
+from .contour import iter_contourf_features
+from .incremental import IncrementalContours
+from .cache import ConversionCache
+from .collection import ContourCollection
+from .aio import AsyncConverter
+from .utilities.stats import ConversionStats
@@ -0,0 +1,161 @@
+"""Run conversions from asyncio code without blocking the event loop."""
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from . import contour
+
+
+class ConversionCancelled(Exception):
+    """Raised in the conversion thread of a stream that was closed or cancelled."""
+
+
+class AsyncConverter:
+    """Async variants of the geojsoncontour functions.
+
+    The conversions run in executor, a concurrent.futures Executor or
+    None for the default executor of the event loop. At most
+    max_concurrent conversions run at the same time, others wait for
+    their turn. The methods take the same arguments as the functions of
+    geojsoncontour, file writes also happen in the executor.
+
+    A conversion that is running cannot be interrupted, use stream() to
+    stop the work when the client is gone.
+    """
+
+    def __init__(self, executor=None, max_concurrent=None):
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def contour_to_geojson(self, contour_set, **kwargs):
+        """Return contour_to_geojson(contour_set, **kwargs)."""
+        return await self._run(contour.contour_to_geojson, (contour_set,), kwargs)
+
+    async def contourf_to_geojson(self, contourf, **kwargs):
+        """Return contourf_to_geojson(contourf, **kwargs)."""
+        return await self._run(contour.contourf_to_geojson, (contourf,), kwargs)
+
+    async def contourf_to_geojson_overlap(self, contourf, **kwargs):
+        """Return contourf_to_geojson_overlap(contourf, **kwargs)."""
+        return await self._run(contour.contourf_to_geojson_overlap, (contourf,), kwargs)
+
+    async def array_to_geojson(self, x, y, z, levels, **kwargs):
+        """Return array_to_geojson(x, y, z, levels, **kwargs)."""
+        return await self._run(contour.array_to_geojson, (x, y, z, levels), kwargs)
+
+    async def stream(self, converter, *args, buffer_chars=2**16, max_pending=4, **kwargs):
+        """Yield the text of converter(*args, **kwargs) in chunks of about buffer_chars characters.
+
+        converter is one of the geojsoncontour functions, which writes
+        to a file object in a thread of executor (a ProcessPoolExecutor
+        can not be used), so serialize can not be False or 'arrays'. The conversion pauses when max_pending chunks
+        are not consumed. When the iterator is closed or cancelled, the
+        conversion stops at the next feature.
+        """
+        for name in ('geojson_filepath', 'strdump'):
+            if name in kwargs:
+                raise TypeError(f"AsyncConverter.stream() got an unexpected keyword argument '{name}'")
+        if kwargs.get('output_format') == contour.OUTPUT_GEOPARQUET:
+            raise ValueError("AsyncConverter.stream() does not support output_format 'geoparquet'")
+        if kwargs.get('serialize', True) in (False, contour.SERIALIZE_ARRAYS):
+            raise ValueError('AsyncConverter.stream() only streams serialized results')
+        if isinstance(self.executor, ProcessPoolExecutor):
+            raise TypeError('AsyncConverter.stream() can not use a ProcessPoolExecutor, the conversion must run '
+                            'in a thread')
+        loop = asyncio.get_running_loop()
+        async with self._semaphore():
+            writer = _ChunkWriter(loop, buffer_chars, max_pending)
+            function = functools.partial(_write_chunks, converter, args, kwargs, writer)
+            future = loop.run_in_executor(self.executor, function)
+            try:
+                while True:
+                    chunk = await writer.queue.get()
+                    if chunk is _DONE:
+                        break
+                    writer.space.release()
+                    yield chunk
+                # Raises the exception of a failed conversion
+                await future
+            finally:
+                writer.cancel()
+                # Hold the concurrency slot until the conversion thread has stopped
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception()
+
+    async def _run(self, function, args, kwargs):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore():
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    def _semaphore(self):
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = (asyncio.Semaphore(self.max_concurrent) if self.max_concurrent
+                                      else _Unlimited())
+        return self._semaphores[loop]
+
+
+_DONE = object()
+
+
+class _ChunkWriter:
+    """File object that passes the written text from the conversion thread to the event loop in chunks."""
+
+    def __init__(self, loop, buffer_chars, max_pending):
+        self.loop = loop
+        self.buffer_chars = buffer_chars
+        self.queue = asyncio.Queue()
+        self.space = threading.Semaphore(max_pending)
+        self.cancelled = threading.Event()
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        if self.cancelled.is_set():
+            raise ConversionCancelled()
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_chars:
+            self.send()
+
+    def send(self):
+        if not self._parts:
+            return
+        chunk = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        self.space.acquire()
+        if self.cancelled.is_set():
+            raise ConversionCancelled()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, chunk)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, _DONE)
+
+    def cancel(self):
+        self.cancelled.set()
+        # Wake up the conversion thread if it waits for space
+        self.space.release()
+
+
+def _write_chunks(converter, args, kwargs, writer):
+    try:
+        converter(*args, geojson_filepath=writer, **kwargs)
+        writer.send()
+    finally:
+        writer.close()
+
+
+class _Unlimited:
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
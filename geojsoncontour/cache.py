@@ -0,0 +1,183 @@
+"""Cache serialized conversion results by a hash of the contour data and the conversion options."""
+
+import collections
+import hashlib
+import inspect
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from matplotlib.colors import Colormap
+
+from . import contour
+
+# Options that do not change the result
+_IGNORED_OPTIONS = ('stats', 'workers')
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ConversionCache:
+    """Least recently used cache of GeoJSON (or other output_format) results.
+
+    The cached converters take the same arguments as the functions of
+    geojsoncontour, without geojson_filepath and strdump, and return the
+    serialized result as UTF-8 bytes. The same bytes object is returned
+    for every hit in memory, so it is never copied.
+
+    The key is a blake2b hash of the contour paths and colors, or of the
+    x, y, z grid for array_to_geojson, and of all conversion options.
+    maxsize results are kept in memory. With a path, results are also
+    stored in a SQLite file, which is shared between processes and
+    limited to max_disk_bytes by removing the least recently used.
+
+    stats and workers do not change the result and are not part of the
+    key. A hit does not fill stats, only a conversion does.
+    """
+
+    def __init__(self, maxsize=128, path=None, max_disk_bytes=None):
+        self.maxsize = maxsize
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                         '(key BLOB PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)')
+
+    def contour_to_geojson(self, contour_set, **kwargs):
+        """Return contour_to_geojson(contour_set, **kwargs) as bytes."""
+        return self._convert(contour.contour_to_geojson, (contour_set,), kwargs,
+                             _contour_set_arrays(contour_set, contour_set.get_edgecolors()))
+
+    def contourf_to_geojson(self, contourf, **kwargs):
+        """Return contourf_to_geojson(contourf, **kwargs) as bytes."""
+        return self._convert(contour.contourf_to_geojson, (contourf,), kwargs,
+                             _contour_set_arrays(contourf, contourf.get_facecolor()))
+
+    def contourf_to_geojson_overlap(self, contourf, **kwargs):
+        """Return contourf_to_geojson_overlap(contourf, **kwargs) as bytes."""
+        return self._convert(contour.contourf_to_geojson_overlap, (contourf,), kwargs,
+                             _contour_set_arrays(contourf, contourf.get_facecolor()))
+
+    def array_to_geojson(self, x, y, z, levels, **kwargs):
+        """Return array_to_geojson(x, y, z, levels, **kwargs) as bytes."""
+        # The mask of a masked z is hashed as well, its data alone is ambiguous
+        return self._convert(contour.array_to_geojson, (x, y, z, levels), kwargs,
+                             [np.asarray(array) for array in (x, y, z, levels)] + [np.ma.getmaskarray(z)])
+
+    def cache_info(self):
+        """Return the hits and misses, and the maximum and current number of results in memory."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._memory))
+
+    def clear(self):
+        """Remove all results from memory and from the SQLite file."""
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute('DELETE FROM results')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _convert(self, function, args, kwargs, arrays):
+        key = self._key(function, args, kwargs, arrays)
+        value = self._get(key)
+        if value is not None:
+            return value
+        result = function(*args, **kwargs, strdump=True)
+        value = result if isinstance(result, bytes) else result.encode('utf-8')
+        self._put(key, value)
+        return value
+
+    @staticmethod
+    def _key(function, args, kwargs, arrays):
+        for name in ('geojson_filepath', 'strdump'):
+            if name in kwargs:
+                raise TypeError(f"ConversionCache.{function.__name__}() got an unexpected keyword argument '{name}'")
+        if kwargs.get('serialize', True) in (False, contour.SERIALIZE_ARRAYS):
+            raise ValueError('ConversionCache only stores serialized results')
+        bound = inspect.signature(function).bind(*args, **kwargs)
+        bound.apply_defaults()
+        # The positional arguments are hashed as arrays
+        options = {name: value for name, value in list(bound.arguments.items())[len(args):]
+                   if name not in _IGNORED_OPTIONS}
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(function.__name__.encode())
+        digest.update(json.dumps(options, sort_keys=True, default=_option_key).encode())
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f'{array.dtype.str}{array.shape}'.encode())
+            digest.update(array.data)
+        return digest.digest()
+
+    def _get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            if self._connection is not None:
+                row = self._connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    with self._connection:
+                        self._connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def _put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            if self._connection is None:
+                return
+            if self.max_disk_bytes is not None and len(value) > self.max_disk_bytes:
+                return
+            with self._connection:
+                self._connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                         (key, value, len(value), time.time()))
+                if self.max_disk_bytes is not None:
+                    self._evict_disk()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        total, = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+        for key, size in self._connection.execute('SELECT key, size FROM results ORDER BY accessed').fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            total -= size
+
+
+def _option_key(value):
+    """Return a JSON serializable representation of an option value for the key."""
+    if isinstance(value, Colormap):
+        # The repr of a Colormap contains its address, its colors determine the result
+        return [value.name, value(np.linspace(0, 1, value.N)).tolist()]
+    return repr(value)
+
+
+def _contour_set_arrays(contour_set, colors):
+    """Return the arrays that determine the conversion of a contour set."""
+    arrays = [np.asarray(contour_set.levels), np.asarray(colors), np.asarray(contour_set.extend)]
+    for path in contour_set.get_paths():
+        arrays.append(path.vertices)
+        arrays.append(path.codes if path.codes is not None else np.empty(0))
+    return arrays
@@ -0,0 +1,154 @@
+"""Command line interface, converts netCDF files to geojson once or as a long-running worker.
+
+    geojsoncontour convert FILE VARIABLE [--workers N]
+    geojsoncontour worker [--socket PATH]
+
+A worker reads one job per line as JSON from stdin, or from every
+connection to a Unix socket, and writes one JSON reply per job:
+
+    {"file": "tas.nc", "variable": "tas", "levels": 20, "output": "{name}_{var}_t{t}_{position}.geojson"}
+
+Only file and variable are required. levels is the number of levels
+per timestep or a list of levels, output the pattern of the filenames
+(see netcdfhelper.OUTPUT_PATTERN), timesteps a list of timesteps (all
+by default) and force writes files that are newer than the netCDF file
+as well, which are skipped otherwise. The reply holds the id of the job,
+if given, and the written and skipped filenames, or the error.
+
+The imports, which take longer than converting a small file, are done
+once per worker, and the datasets of the max_datasets most recently
+used files are kept open.
+"""
+import argparse
+import collections
+import json
+import os
+import socketserver
+import stat
+import sys
+
+from .utilities import netcdfhelper
+
+
+class Worker:
+    """Run conversion jobs, keeping the most recently used datasets open."""
+
+    def __init__(self, max_datasets=8, memory_budget=None):
+        self.max_datasets = max_datasets
+        self.memory_budget = memory_budget
+        self._datasets = collections.OrderedDict()
+
+    def run(self, job):
+        """Run a job, a dict as described in the module docstring, and return the reply."""
+        if 'file' not in job or 'variable' not in job:
+            raise ValueError("a job requires 'file' and 'variable'")
+        path = os.path.realpath(job['file'])
+        mtime = os.path.getmtime(path)
+        data = self.dataset(path, mtime)
+        name, ext = os.path.splitext(path)
+        written, skipped = netcdfhelper.dataset_to_geojson(
+            data, job['variable'], name,
+            timesteps=job.get('timesteps'),
+            memory_budget=self.memory_budget,
+            levels=job.get('levels', 20),
+            output_pattern=job.get('output', netcdfhelper.OUTPUT_PATTERN),
+            newer_than=None if job.get('force') else mtime
+        )
+        return {'written': written, 'skipped': skipped}
+
+    def dataset(self, path, mtime):
+        """Return the open dataset of path, which is reopened if the file was modified since."""
+        if path in self._datasets:
+            opened_mtime, data = self._datasets.pop(path)
+            if opened_mtime == mtime:
+                self._datasets[path] = opened_mtime, data
+                return data
+            data.close()
+        data = netcdfhelper.load(path)
+        self._datasets[path] = mtime, data
+        while len(self._datasets) > self.max_datasets:
+            _, (_, evicted) = self._datasets.popitem(last=False)
+            evicted.close()
+        return data
+
+    def serve(self, lines, write):
+        """Run the job on each of lines and write the reply as a line of JSON."""
+        for line in lines:
+            if not line.strip():
+                continue
+            reply = {}
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError('a job must be a JSON object')
+                if 'id' in job:
+                    reply['id'] = job['id']
+                reply.update(self.run(job))
+            except Exception as error:
+                reply['error'] = '{}: {}'.format(type(error).__name__, error)
+            write(json.dumps(reply) + '\n')
+
+    def close(self):
+        while self._datasets:
+            _, (_, data) = self._datasets.popitem()
+            data.close()
+
+
+def serve_unix_socket(worker, path):
+    """Run jobs from connections to a Unix socket at path, one connection at a time."""
+
+    class Handler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            def write(text):
+                self.wfile.write(text.encode('utf-8'))
+                self.wfile.flush()
+            worker.serve((line.decode('utf-8') for line in self.rfile), write)
+
+    if os.path.exists(path):
+        # A socket left by a previous worker, any other file is not removed
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise FileExistsError(f'{path} exists and is not a socket')
+        os.remove(path)
+    with socketserver.UnixStreamServer(path, Handler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='geojsoncontour', description='Convert netCDF files to geojson.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='write a geojson file for each timestep of a variable')
+    convert.add_argument('file')
+    convert.add_argument('variable')
+    convert.add_argument('--workers', type=int, default=1, help='number of processes')
+    convert.add_argument('--memory-budget', type=int, help='bytes of a variable to read at once')
+    worker = subparsers.add_parser('worker', help='run jobs read from stdin or a Unix socket')
+    worker.add_argument('--socket', help='path of a Unix socket to read jobs from instead of stdin')
+    worker.add_argument('--max-datasets', type=int, default=8, help='number of datasets to keep open')
+    worker.add_argument('--memory-budget', type=int, help='bytes of a variable to read at once')
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        netcdfhelper.netcdf_to_geojson(args.file, args.variable, workers=args.workers,
+                                       memory_budget=args.memory_budget)
+        return
+    worker = Worker(args.max_datasets, args.memory_budget)
+    try:
+        if args.socket:
+            serve_unix_socket(worker, args.socket)
+        else:
+            def write(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            worker.serve(sys.stdin, write)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+
+
+if __name__ == '__main__':
+    main()
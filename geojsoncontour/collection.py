@@ -0,0 +1,170 @@
+"""Feature collection that stores all coordinates in one array, with GeoArrow style offsets."""
+
+import geojson
+import numpy as np
+from geojson import Feature, FeatureCollection
+
+from .utilities.arrow import collection_to_table, write_geoparquet
+from .utilities.writer import GEOJSON_PRECISION, feature_to_str
+
+
+class ContourCollection:
+    """Features with all vertices in a single (n, 2) float array.
+
+    Every geometry is stored as parts made of rings (or lines), like
+    GeoArrow: feature_offsets index part_offsets, part_offsets index
+    ring_offsets and ring_offsets index coordinates. A LineString has one
+    part with one line, a Polygon one part. properties holds a list for
+    each property name, with None for features without that property.
+    geojson objects are only created on access.
+    """
+
+    def __init__(self, geometry_types, coordinates, ring_offsets, part_offsets, feature_offsets, properties):
+        self.geometry_types = list(geometry_types)
+        self.coordinates = coordinates
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.feature_offsets = feature_offsets
+        self.properties = properties
+
+    @classmethod
+    def from_features(cls, features):
+        """Create a collection from (geometry_type, coordinates, properties) features."""
+        geometry_types = []
+        rings = []
+        rings_per_part = []
+        parts_per_feature = []
+        feature_properties = []
+        for geometry_type, coordinates, properties in features:
+            geometry_types.append(geometry_type)
+            feature_properties.append(properties)
+            if geometry_type == 'LineString':
+                parts = [[coordinates]]
+            elif geometry_type == 'Polygon':
+                parts = [coordinates]
+            else:
+                parts = coordinates
+            parts_per_feature.append(len(parts))
+            for part in parts:
+                rings_per_part.append(len(part))
+                rings.extend(part)
+        if rings:
+            coordinates = np.concatenate(rings).astype(float, copy=False)
+        else:
+            coordinates = np.empty((0, 2))
+        ring_offsets = _offsets([len(ring) for ring in rings])
+        columns = {}
+        for properties in feature_properties:
+            for name in properties:
+                columns.setdefault(name, None)
+        properties = {name: [feature.get(name) for feature in feature_properties] for name in columns}
+        return cls(geometry_types, coordinates, ring_offsets, _offsets(rings_per_part),
+                   _offsets(parts_per_feature), properties)
+
+    def __len__(self):
+        return len(self.geometry_types)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        """Return a feature as geojson Feature."""
+        if not -len(self) <= index < len(self):
+            raise IndexError('feature index out of range')
+        index %= len(self)
+        geometry_type = self.geometry_types[index]
+        coordinates = _tolist(self.geometry_coordinates(index))
+        return Feature(geometry=getattr(geojson, geometry_type)(coordinates=coordinates),
+                       properties=self.feature_properties(index))
+
+    @property
+    def nbytes(self):
+        """Return the number of bytes of the coordinate and offset arrays."""
+        return sum(array.nbytes for array in (self.coordinates, self.ring_offsets, self.part_offsets,
+                                              self.feature_offsets))
+
+    @property
+    def __geo_interface__(self):
+        return {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': geometry_type, 'coordinates': _tolist(self.geometry_coordinates(index))},
+                'properties': self.feature_properties(index),
+            } for index, geometry_type in enumerate(self.geometry_types)],
+        }
+
+    def geometry_coordinates(self, index):
+        """Return the coordinates of a feature as nested views of the coordinate array."""
+        geometry_type = self.geometry_types[index]
+        parts = [[self.coordinates[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+                  for ring in range(self.part_offsets[part], self.part_offsets[part + 1])]
+                 for part in range(self.feature_offsets[index], self.feature_offsets[index + 1])]
+        if geometry_type == 'LineString':
+            return parts[0][0]
+        if geometry_type == 'Polygon':
+            return parts[0]
+        return parts
+
+    def feature_properties(self, index):
+        """Return the properties of a feature as dict."""
+        return {name: column[index] for name, column in self.properties.items() if column[index] is not None}
+
+    def features(self):
+        """Yield the (geometry_type, coordinates, properties) features."""
+        for index, geometry_type in enumerate(self.geometry_types):
+            yield geometry_type, self.geometry_coordinates(index), self.feature_properties(index)
+
+    def to_geojson(self):
+        """Return the features as geojson FeatureCollection."""
+        return FeatureCollection(list(self))
+
+    def dumps(self, precision=GEOJSON_PRECISION):
+        """Return the GeoJSON string, the same as geojson.dumps of to_geojson with sorted keys.
+
+        Like geojson, coordinates are rounded to precision decimals. Pass
+        None to skip the rounding of coordinates that are already rounded.
+        """
+        return ''.join(['{"features":[',
+                        ','.join(feature_to_str(*feature, precision=precision) for feature in self.features()),
+                        '],"type":"FeatureCollection"}'])
+
+    def ragged_array(self):
+        """Return (geometry_type, coordinates, offsets) like shapely.to_ragged_array.
+
+        The offsets go from the coordinates outwards and share memory with
+        the collection, so shapely.from_ragged_array can use them without
+        copies. All features must have the same geometry type.
+        """
+        geometry_types = set(self.geometry_types)
+        if len(geometry_types) > 1:
+            raise ValueError(f'Features have different geometry types: {sorted(geometry_types)}')
+        geometry_type = geometry_types.pop() if geometry_types else 'MultiPolygon'
+        if geometry_type == 'LineString':
+            offsets = (self.ring_offsets,)
+        elif geometry_type == 'Polygon':
+            offsets = (self.ring_offsets, self.part_offsets)
+        else:
+            offsets = (self.ring_offsets, self.part_offsets, self.feature_offsets)
+        return geometry_type, self.coordinates, offsets
+
+    def to_arrow(self, geometry_column='geometry'):
+        """Return a pyarrow Table with a native GeoArrow geometry column and a column per property."""
+        return collection_to_table(self, geometry_column)
+
+    def to_parquet(self, where, geometry_column='geometry'):
+        """Write a GeoParquet file to where, a path or binary file object. Requires pyarrow."""
+        write_geoparquet(self.to_arrow(geometry_column), where)
+
+
+def _offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _tolist(coordinates):
+    if isinstance(coordinates, np.ndarray):
+        return coordinates.tolist()
+    return [_tolist(item) for item in coordinates]
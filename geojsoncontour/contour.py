@@ -1,110 +1,596 @@
 """Transform matplotlib.contour(f) to GeoJSON."""
 
+import functools
+import io
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+
+import contourpy
 import geojson
+import matplotlib
 import numpy as np
-from matplotlib.colors import rgb2hex
+from contourpy import FillType, LineType
+from matplotlib.colors import Normalize, rgb2hex
 from geojson import Feature, LineString
-from geojson import Polygon, FeatureCollection
+from geojson import Polygon, MultiPolygon, FeatureCollection
 
-from .utilities.multipoly import multi_polygon, keep_high_angle, set_contourf_properties,get_contourf_levels
+from .collection import ContourCollection
+from .utilities.multipoly import multi_polygon_rings, filled_polygon_rings, generator_polygon_rings
+from .utilities.multipoly import concatenate_rings, keep_high_angle, ring_metrics
+from .utilities.multipoly import set_contourf_properties,get_contourf_levels
+from .utilities.simplify import simplify_line, simplify_ring
+from .utilities.stats import collect_stats, count_features, count_output, timed
+from .utilities.tiles import iter_tiles, write_mbtiles, write_tile_directory
+from .utilities.topojson import topology_to_str
 from .utilities.vertices import get_vertices_from_path
+from .utilities.writer import GEOJSON_PRECISION, RECORD_SEPARATOR, feature_to_str, quantized_feature_to_str
+from .utilities.writer import replace_on_success, text_writer, write_feature_collection, write_feature_sequence
+
+SERIALIZE_FAST = 'fast'
+SERIALIZE_ARRAYS = 'arrays'
+SERIALIZE_QUANTIZED = 'quantized'
+
+OUTPUT_GEOJSON = 'geojson'
+OUTPUT_GEOJSONSEQ = 'geojsonseq'
+OUTPUT_NDJSON = 'ndjson'
+OUTPUT_TOPOJSON = 'topojson'
+OUTPUT_GEOPARQUET = 'geoparquet'
+OUTPUT_FORMATS = (OUTPUT_GEOJSON, OUTPUT_GEOJSONSEQ, OUTPUT_NDJSON, OUTPUT_TOPOJSON, OUTPUT_GEOPARQUET)
+
+# Number of vertices converted in one task with workers
+BATCH_VERTICES = 2**16
+
+# Bounds of the extended layers, same as matplotlib
+EXTENDED_LEVEL = 1e250
+
+GEOMETRY_TYPES = {
+    'LineString': LineString,
+    'Polygon': Polygon,
+    'MultiPolygon': MultiPolygon,
+}
 
 
 def contour_to_geojson(contour, geojson_filepath=None, min_angle_deg=None,
                        ndigits=5, unit='', stroke_width=1, geojson_properties=None, strdump=False,
-                       serialize=True):
-    """Transform matplotlib.contour to geojson."""
-    line_features = []
+                       serialize=True, simplify=None, simplify_tolerance=0.0, output_format=OUTPUT_GEOJSON,
+                       workers=None, stats=None):
+    """Transform matplotlib.contour to geojson.
+
+    geojson_filepath can also be a writable file object, features are
+    then written one at a time.
+    simplify can be 'douglas-peucker' or 'visvalingam' to simplify lines
+    with simplify_tolerance as maximum distance or minimum triangle area.
+    Use serialize='fast' to write the GeoJSON text directly from the
+    vertex arrays, without creating geojson objects. serialize='arrays'
+    returns a ContourCollection, with all vertices in one numpy array.
+    serialize='quantized' rounds all vertices of a feature at once to
+    ndigits (6 if None) and writes them with ndigits fixed decimals,
+    without the consecutive duplicate vertices that rounding creates.
+    output_format 'geojsonseq' writes RFC 8142 GeoJSON text sequences and
+    'ndjson' newline delimited features instead of a FeatureCollection,
+    file objects are flushed after each feature. 'topojson' writes a
+    TopoJSON topology in which boundaries shared by features are stored once.
+    'geoparquet' writes a GeoParquet file with GeoArrow geometries, or
+    returns its bytes without geojson_filepath, and requires pyarrow.
+    workers is a number of threads, or a concurrent.futures Executor, to
+    convert batches of lines in parallel. The output is the same.
+    stats is a ConversionStats that records the time of each stage and
+    the number of features, rings, vertices and output bytes, or a
+    function that is called with a ConversionStats after the conversion.
+    """
+    line_features = _contour_features(contour, min_angle_deg, _feature_ndigits(ndigits, serialize), unit,
+                                      stroke_width, geojson_properties, simplify, simplify_tolerance, workers)
+    return _render(line_features, stats, geojson_filepath, strdump, serialize, ndigits, output_format)
+
+
+def contourf_to_geojson_overlap(contourf, geojson_filepath=None, min_angle_deg=None,
+                                ndigits=5, unit='', stroke_width=1, fill_opacity=.9,
+                                geojson_properties=None, strdump=False, serialize=True,
+                                simplify=None, simplify_tolerance=0.0, output_format=OUTPUT_GEOJSON, stats=None,
+                                min_area=None):
+    """Transform matplotlib.contourf to geojson with overlapping filled contours."""
+    polygon_features = _contourf_overlap_features(contourf, min_angle_deg, _feature_ndigits(ndigits, serialize), unit,
+                                                  stroke_width, fill_opacity, geojson_properties, simplify,
+                                                  simplify_tolerance, min_area)
+    return _render(polygon_features, stats, geojson_filepath, strdump, serialize, ndigits, output_format)
+
+
+def contourf_to_geojson(contourf, geojson_filepath=None, min_angle_deg=None,
+                        ndigits=5, unit='', stroke_width=1, fill_opacity=.9, fill_opacity_range=None,
+                        geojson_properties=None, strdump=False, serialize=True,
+                        simplify=None, simplify_tolerance=0.0, output_format=OUTPUT_GEOJSON, workers=None,
+                        stats=None, min_area=None):
+    """Transform matplotlib.contourf to geojson with MultiPolygons.
+
+    Every band is contoured again with the contourpy generator of
+    contourf, which returns each polygon with its own holes, instead of
+    assigning holes by the orientation of the paths. This costs about a
+    tenth of the conversion time. Contour sets without a contourpy
+    generator, like unpickled or tricontourf ones, use the paths.
+    Holes are kept inside their shell when simplify is used.
+    workers converts batches of polygons in parallel, see contour_to_geojson.
+    min_area drops rings with a smaller area, in squared coordinate units,
+    after rounding to ndigits. Holes are dropped with their shell.
+    """
+    polygon_features = _contourf_features(contourf, min_angle_deg, _feature_ndigits(ndigits, serialize), unit,
+                                          stroke_width, fill_opacity, fill_opacity_range, geojson_properties,
+                                          simplify, simplify_tolerance, workers, min_area)
+    return _render(polygon_features, stats, geojson_filepath, strdump, serialize, ndigits, output_format)
+
+
+def array_to_geojson(x, y, z, levels, filled=True, geojson_filepath=None, min_angle_deg=None,
+                     ndigits=5, unit='', stroke_width=1, fill_opacity=.9, fill_opacity_range=None,
+                     geojson_properties=None, strdump=False, serialize=True, simplify=None, simplify_tolerance=0.0,
+                     output_format=OUTPUT_GEOJSON, cmap='viridis', extend='neither', chunk_size=None, stats=None,
+                     min_area=None, algorithm=None):
+    """Contour the grid x, y, z and transform it to geojson, without a matplotlib figure.
+
+    The contours are generated with contourpy, the engine behind
+    matplotlib.contour(f). x and y can be 1-D or 2-D. levels are the
+    contour levels, colors are taken from cmap like matplotlib does.
+    algorithm is the name of the contourpy algorithm, by default the
+    rcParams['contour.algorithm'] of matplotlib. With the default,
+    filled contours result in the same features as contourf_to_geojson,
+    lines (filled=False) in the same features as contour_to_geojson.
+    Other algorithms result in the same properties and colors, but
+    the vertex order may differ.
+    chunk_size is passed to contourpy to contour the grid in chunks,
+    filled polygons are then split at the chunk boundaries.
+    min_area drops small filled rings, see contourf_to_geojson.
+    """
+    features = _array_features(x, y, z, levels, filled, min_angle_deg, _feature_ndigits(ndigits, serialize), unit,
+                               stroke_width, fill_opacity, fill_opacity_range, geojson_properties, simplify,
+                               simplify_tolerance, cmap, extend, chunk_size, min_area, algorithm)
+    return _render(features, stats, geojson_filepath, strdump, serialize, ndigits, output_format)
+
+
+def contour_to_tiles(contour, destination, zooms, min_angle_deg=None, ndigits=5, unit='', stroke_width=1,
+                     geojson_properties=None, tolerance=1.0, buffer=0.0):
+    """Write the lines of matplotlib.contour as z/x/y tiles for web maps.
+
+    contour must be drawn in longitude, latitude coordinates. Every zoom
+    in zooms is simplified with tolerance in pixels and clipped to the
+    tiles extended by buffer pixels. destination is a directory for
+    z/x/y.geojson files, or a SQLite file if it ends with '.mbtiles'.
+    Returns the number of tiles written.
+    """
+    line_features = _contour_features(contour, min_angle_deg, ndigits, unit, stroke_width,
+                                      geojson_properties, None, 0.0)
+    return _render_tiles(line_features, destination, zooms, ndigits, tolerance, buffer)
+
+
+def contourf_to_tiles(contourf, destination, zooms, min_angle_deg=None, ndigits=5, unit='', stroke_width=1,
+                      fill_opacity=.9, fill_opacity_range=None, geojson_properties=None, tolerance=1.0, buffer=0.0,
+                      min_area=None):
+    """Write the MultiPolygons of contourf_to_geojson as z/x/y tiles, see contour_to_tiles."""
+    polygon_features = _contourf_features(contourf, min_angle_deg, ndigits, unit, stroke_width, fill_opacity,
+                                          fill_opacity_range, geojson_properties, None, 0.0, min_area=min_area)
+    return _render_tiles(polygon_features, destination, zooms, ndigits, tolerance, buffer)
+
+
+def batch_to_geojson(converter, items, geojson_filepaths=None, workers=None, **options):
+    """Convert many contour sets with the same options, return the results in the order of items.
+
+    converter is contour_to_geojson, contourf_to_geojson,
+    contourf_to_geojson_overlap or array_to_geojson, items are contour
+    sets or (x, y, z, levels) tuples for array_to_geojson. options are
+    passed to every conversion. With geojson_filepaths, one for each
+    item, the results are written to these files. workers converts the
+    items in parallel, as number of threads or as Executor. The titles
+    and colors of levels are computed once for items that share them.
+    """
+    items = list(items)
+    if geojson_filepaths is None:
+        geojson_filepaths = [None] * len(items)
+    geojson_filepaths = list(geojson_filepaths)
+    if len(geojson_filepaths) != len(items):
+        raise ValueError(f'Got {len(geojson_filepaths)} geojson_filepaths for {len(items)} items')
+    if not workers:
+        return [_convert_item(converter, item, geojson_filepath, options)
+                for item, geojson_filepath in zip(items, geojson_filepaths)]
+    with _executor(workers) as executor:
+        futures = [executor.submit(_convert_item, converter, item, geojson_filepath, options)
+                   for item, geojson_filepath in zip(items, geojson_filepaths)]
+        return [future.result() for future in futures]
+
+
+def _convert_item(converter, item, geojson_filepath, options):
+    args = item if converter is array_to_geojson else (item,)
+    return converter(*args, geojson_filepath=geojson_filepath, **options)
+
+
+def iter_contour_features(contour, min_angle_deg=None, ndigits=5, unit='', stroke_width=1,
+                          geojson_properties=None, simplify=None, simplify_tolerance=0.0):
+    """Yield the geojson Features of contour_to_geojson one at a time."""
+    for feature in _contour_features(contour, min_angle_deg, ndigits, unit, stroke_width,
+                                     geojson_properties, simplify, simplify_tolerance):
+        yield _to_geojson_feature(*feature)
+
+
+def iter_contourf_overlap_features(contourf, min_angle_deg=None, ndigits=5, unit='', stroke_width=1,
+                                   fill_opacity=.9, geojson_properties=None, simplify=None, simplify_tolerance=0.0,
+                                   min_area=None):
+    """Yield the geojson Features of contourf_to_geojson_overlap one at a time."""
+    for feature in _contourf_overlap_features(contourf, min_angle_deg, ndigits, unit, stroke_width, fill_opacity,
+                                              geojson_properties, simplify, simplify_tolerance, min_area):
+        yield _to_geojson_feature(*feature)
+
+
+def iter_contourf_features(contourf, min_angle_deg=None, ndigits=5, unit='', stroke_width=1, fill_opacity=.9,
+                           fill_opacity_range=None, geojson_properties=None, simplify=None, simplify_tolerance=0.0,
+                           min_area=None):
+    """Yield the geojson Features of contourf_to_geojson one at a time."""
+    for feature in _contourf_features(contourf, min_angle_deg, ndigits, unit, stroke_width, fill_opacity,
+                                      fill_opacity_range, geojson_properties, simplify, simplify_tolerance,
+                                      min_area=min_area):
+        yield _to_geojson_feature(*feature)
+
+
+def _contour_features(contour, min_angle_deg, ndigits, unit, stroke_width, geojson_properties,
+                      simplify, simplify_tolerance, workers=None):
     paths = contour.get_paths()
     colors = contour.get_edgecolors()
     levels = contour.levels
+    if workers:
+        yield from _parallel_contour_features(paths, colors, levels, min_angle_deg, ndigits, unit, stroke_width,
+                                              geojson_properties, simplify, simplify_tolerance, workers)
+        return
     for contour_index, (path, color, level) in enumerate(zip(paths, colors, levels)):
-        for coordinates in get_vertices_from_path(path):
-            if len(coordinates) < 3:
-                continue
-            if np.all(np.equal(coordinates, coordinates[0])):
-                # Matplotlib sometimes emits empty paths which
-                # can be ignored
-                continue
-            if min_angle_deg:
-                coordinates = keep_high_angle(coordinates, min_angle_deg)
-            if ndigits:
-                coordinates = np.around(coordinates, ndigits)
-            line = LineString(coordinates.tolist())
-            properties = {
-                "stroke-width": stroke_width,
-                "stroke": rgb2hex(color),
-                "title": f"{level:.2f} {unit}",
-                "level-value": float(f"{level:.6f}"),
-                "level-index": contour_index
-            }
-            if geojson_properties:
-                properties.update(geojson_properties)
-            line_features.append(Feature(geometry=line, properties=properties))
-
-    feature_collection = FeatureCollection(line_features)
-    return _render_feature_collection(feature_collection, geojson_filepath, strdump, serialize)
+        yield from _line_features(get_vertices_from_path(path), color, level, contour_index, min_angle_deg,
+                                  ndigits, unit, stroke_width, geojson_properties, simplify, simplify_tolerance)
 
 
-def contourf_to_geojson_overlap(contourf, geojson_filepath=None, min_angle_deg=None,
-                                ndigits=5, unit='', stroke_width=1, fill_opacity=.9,
-                                geojson_properties=None, strdump=False, serialize=True):
-    """Transform matplotlib.contourf to geojson with overlapping filled contours."""
-    polygon_features = []
-    contourf_levels = get_contourf_levels(contourf.levels, contourf.extend)
+def _parallel_contour_features(paths, colors, levels, min_angle_deg, ndigits, unit, stroke_width,
+                               geojson_properties, simplify, simplify_tolerance, workers):
+    with _executor(workers) as executor:
+        futures = []
+        for contour_index, (path, color, level) in enumerate(zip(paths, colors, levels)):
+            lines = list(get_vertices_from_path(path))
+            for start, stop in _batches(lines):
+                futures.append(executor.submit(_line_feature_list, lines[start:stop], color, level, contour_index,
+                                               min_angle_deg, ndigits, unit, stroke_width, geojson_properties,
+                                               simplify, simplify_tolerance))
+        for future in futures:
+            yield from future.result()
+
+
+def _line_feature_list(*args):
+    return list(_line_features(*args))
+
+
+def _line_features(lines, color, level, contour_index, min_angle_deg, ndigits, unit, stroke_width,
+                   geojson_properties, simplify, simplify_tolerance):
+    # All lines of a level share the same properties
+    properties = {
+        "stroke-width": stroke_width,
+        "stroke": _hex_color(tuple(color)),
+        "title": f"{level:.2f} {unit}",
+        "level-value": float(f"{level:.6f}"),
+        "level-index": contour_index
+    }
+    if geojson_properties:
+        properties.update(geojson_properties)
+    for coordinates in lines:
+        if len(coordinates) < 3:
+            continue
+        if np.all(np.equal(coordinates, coordinates[0])):
+            # Matplotlib sometimes emits empty paths which
+            # can be ignored
+            continue
+        if min_angle_deg:
+            coordinates = keep_high_angle(coordinates, min_angle_deg)
+        if simplify:
+            coordinates = simplify_line(coordinates, simplify, simplify_tolerance)
+        if ndigits:
+            coordinates = np.around(coordinates, ndigits)
+        yield 'LineString', coordinates, dict(properties)
+
+
+def _contourf_overlap_features(contourf, min_angle_deg, ndigits, unit, stroke_width, fill_opacity,
+                               geojson_properties, simplify, simplify_tolerance, min_area=None):
+    contourf_levels = _contourf_level_labels(tuple(contourf.levels), contourf.extend)
     contourf_colors = contourf.get_facecolor()
     for path, level, color in zip(contourf.get_paths(), contourf_levels, contourf_colors):
+        properties = set_contourf_properties(stroke_width, _hex_color(tuple(color)), fill_opacity, level, unit)
+        if geojson_properties:
+            properties.update(geojson_properties)
+        rings = []
         for coord in get_vertices_from_path(path):
             if min_angle_deg:
                 coord = keep_high_angle(coord, min_angle_deg)
+            if simplify:
+                coord = simplify_ring(coord, simplify, simplify_tolerance)
+                if coord is None:
+                    continue
             if ndigits:
                 coord = np.around(coord, ndigits)
-            polygon = Polygon(coordinates=[coord.tolist()])
-            fcolor = rgb2hex(color)
-            properties = set_contourf_properties(stroke_width, fcolor, fill_opacity, level, unit)
-            if geojson_properties:
-                properties.update(geojson_properties)
-            feature = Feature(geometry=polygon, properties=properties)
-            polygon_features.append(feature)
-    feature_collection = FeatureCollection(polygon_features)
-    return _render_feature_collection(feature_collection, geojson_filepath, strdump, serialize)
+            rings.append(coord)
+        if min_area and rings:
+            areas = ring_metrics(*concatenate_rings(rings)).area
+            rings = [ring for ring, area in zip(rings, areas) if abs(area) >= min_area]
+        for coord in rings:
+            yield 'Polygon', [coord], dict(properties)
 
 
-def contourf_to_geojson(contourf, geojson_filepath=None, min_angle_deg=None,
-                        ndigits=5, unit='', stroke_width=1, fill_opacity=.9, fill_opacity_range=None,
-                        geojson_properties=None, strdump=False, serialize=True):
-    """Transform matplotlib.contourf to geojson with MultiPolygons."""
+def _contourf_features(contourf, min_angle_deg, ndigits, unit, stroke_width, fill_opacity, fill_opacity_range,
+                       geojson_properties, simplify, simplify_tolerance, workers=None, min_area=None):
+    if workers:
+        level_polygons = _parallel_contourf_level_polygons(contourf, min_angle_deg, ndigits, simplify,
+                                                           simplify_tolerance, workers, min_area)
+    else:
+        level_polygons = _contourf_level_polygons(contourf, min_angle_deg, ndigits, simplify, simplify_tolerance,
+                                                  min_area)
+    contourf_levels = _contourf_level_labels(tuple(contourf.levels), contourf.extend)
+    yield from _multi_polygon_features(level_polygons, contourf_levels, contourf.get_facecolor(),
+                                       len(contourf.levels), unit, stroke_width, fill_opacity,
+                                       fill_opacity_range, geojson_properties)
+
+
+def _contourf_level_polygons(contourf, min_angle_deg, ndigits, simplify, simplify_tolerance, min_area=None):
+    # The contourpy generator of a QuadContourSet returns every polygon
+    # together with its holes. Without it, for example after unpickling
+    # or for a TriContourSet, holes are assigned to shells based on the
+    # orientation of the paths.
+    generator = _contourpy_generator(contourf)
+    if generator is None:
+        for path in contourf.get_paths():
+            yield multi_polygon_rings(path, min_angle_deg, ndigits, simplify, simplify_tolerance, min_area)
+        return
+    for lower, upper in zip(*contourf._get_lowers_and_uppers()):
+        yield generator_polygon_rings(generator, lower, upper, min_angle_deg, ndigits, simplify, simplify_tolerance,
+                                      min_area)
+
+
+def _parallel_contourf_level_polygons(contourf, min_angle_deg, ndigits, simplify, simplify_tolerance, workers,
+                                      min_area=None):
+    # The contourpy generator is not thread-safe, it is only called from
+    # this thread. The polygons it returns are converted in batches.
+    generator = _contourpy_generator(contourf)
+    with _executor(workers) as executor:
+        level_futures = []
+        if generator is None:
+            for path in contourf.get_paths():
+                level_futures.append([executor.submit(multi_polygon_rings, path, min_angle_deg, ndigits,
+                                                      simplify, simplify_tolerance, min_area)])
+        else:
+            for lower, upper in zip(*contourf._get_lowers_and_uppers()):
+                filled = generator.filled(lower, upper)
+                points, offsets = contourpy.convert_filled(filled, generator.fill_type, FillType.OuterOffset)
+                level_futures.append([executor.submit(filled_polygon_rings, points[start:stop],
+                                                      offsets[start:stop], min_angle_deg, ndigits, simplify,
+                                                      simplify_tolerance, min_area)
+                                      for start, stop in _batches(points)])
+        for futures in level_futures:
+            yield [polygon for future in futures for polygon in future.result()]
+
+
+def _contourpy_generator(contour_set):
+    """Return the contourpy generator of contour_set, None if it has none (a TriContourSet has another kind)."""
+    generator = getattr(contour_set, '_contour_generator', None)
+    if isinstance(generator, contourpy.ContourGenerator):
+        return generator
+    return None
+
+
+def _executor(workers):
+    if isinstance(workers, Executor):
+        return nullcontext(workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def _batches(arrays):
+    """Return (start, stop) ranges of consecutive arrays with about BATCH_VERTICES vertices."""
+    batches = []
+    start = 0
+    n_vertices = 0
+    for index, array in enumerate(arrays):
+        n_vertices += len(array)
+        if n_vertices >= BATCH_VERTICES:
+            batches.append((start, index + 1))
+            start = index + 1
+            n_vertices = 0
+    if start < len(arrays):
+        batches.append((start, len(arrays)))
+    return batches
+
+
+def _multi_polygon_features(level_polygons, contourf_levels, colors, n_levels, unit, stroke_width, fill_opacity,
+                            fill_opacity_range, geojson_properties):
     if fill_opacity_range:
         variable_opacity = True
         min_opacity, max_opacity = fill_opacity_range
-        opacity_increment = (max_opacity - min_opacity) / len(contourf.levels)
+        opacity_increment = (max_opacity - min_opacity) / n_levels
         fill_opacity = min_opacity
     else:
         variable_opacity = False
-    polygon_features = []
-    contourf_levels = get_contourf_levels(contourf.levels, contourf.extend)
-    contourf_colors = contourf.get_facecolor()
-    for path, level, color in zip(contourf.get_paths(), contourf_levels, contourf_colors):
-        polygon = multi_polygon(path, min_angle_deg, ndigits)
-        if not polygon.coordinates:
+    for polygons, level, color in zip(level_polygons, contourf_levels, colors):
+        if not polygons:
             continue
-        fcolor = rgb2hex(color)
-        properties = set_contourf_properties(stroke_width, fcolor, fill_opacity, level, unit)
+        properties = set_contourf_properties(stroke_width, _hex_color(tuple(color)), fill_opacity, level, unit)
         if geojson_properties:
             properties.update(geojson_properties)
-        feature = Feature(geometry=polygon, properties=properties)
-        polygon_features.append(feature)
-        # print(len(polygon.coordinates))
+        yield 'MultiPolygon', polygons, properties
         if variable_opacity:
             fill_opacity += opacity_increment
-    feature_collection = FeatureCollection(polygon_features)
-    return _render_feature_collection(feature_collection, geojson_filepath, strdump, serialize)
 
 
-def _render_feature_collection(feature_collection, geojson_filepath, strdump, serialize):
+def _array_features(x, y, z, levels, filled, min_angle_deg, ndigits, unit, stroke_width, fill_opacity,
+                    fill_opacity_range, geojson_properties, simplify, simplify_tolerance, cmap, extend, chunk_size,
+                    min_area=None, algorithm=None):
+    generator = _array_contour_generator(x, y, z, algorithm, chunk_size)
+    levels = np.asarray(levels, dtype=float)
+    bounds = _extended_levels(levels, extend) if filled else levels
+    colors = _layer_colors(levels, bounds, filled, cmap)
+    if not filled:
+        for contour_index, (level, color) in enumerate(zip(levels, colors)):
+            yield from _line_features(_generator_lines(generator, level), color, level, contour_index, min_angle_deg,
+                                      ndigits, unit, stroke_width, geojson_properties, simplify, simplify_tolerance)
+        return
+    level_polygons = (generator_polygon_rings(generator, lower, upper, min_angle_deg, ndigits,
+                                              simplify, simplify_tolerance, min_area)
+                      for lower, upper in zip(_layer_lowers(bounds, z), bounds[1:]))
+    yield from _multi_polygon_features(level_polygons, _contourf_level_labels(tuple(levels), extend), colors,
+                                       len(levels), unit, stroke_width, fill_opacity, fill_opacity_range,
+                                       geojson_properties)
+
+
+def _array_contour_generator(x, y, z, algorithm=None, chunk_size=None):
+    """Return a contourpy generator for the grid like matplotlib creates, algorithm defaults to its rcParams."""
+    if algorithm is None:
+        algorithm = matplotlib.rcParams['contour.algorithm']
+    return contourpy.contour_generator(x, y, np.ma.masked_invalid(z), name=algorithm,
+                                       corner_mask=matplotlib.rcParams['contour.corner_mask'], chunk_size=chunk_size)
+
+
+def _generator_lines(generator, level):
+    """Return the lines of generator at level as separate vertex arrays, whatever the line type of the algorithm."""
+    return contourpy.convert_lines(generator.lines(level), generator.line_type, LineType.Separate)
+
+
+def _layer_colors(levels, bounds, filled, cmap):
+    # Like matplotlib, filled contours are colored by the middle of the layer
+    layers = 0.5 * (bounds[:-1] + bounds[1:]) if filled else levels
+    cmap = matplotlib.colormaps[cmap] if isinstance(cmap, str) else cmap
+    return cmap(Normalize(vmin=levels.min(), vmax=levels.max())(layers))
+
+
+def _layer_lowers(bounds, z):
+    lowers = bounds[:-1].copy()
+    if lowers[0] == np.nanmin(z):
+        # Include the lowest values in the first layer, like matplotlib
+        lowers[0] -= 1
+    return lowers
+
+
+@functools.lru_cache(maxsize=1024)
+def _hex_color(rgba):
+    return rgb2hex(rgba)
+
+
+@functools.lru_cache(maxsize=256)
+def _contourf_level_labels(levels, extend):
+    """Return the titles of the layers, these are the same for contour sets with the same levels."""
+    return tuple(get_contourf_levels(levels, extend))
+
+
+def _extended_levels(levels, extend):
+    lower, upper = [], []
+    if extend in ('both', 'min'):
+        lower = [-EXTENDED_LEVEL]
+    if extend in ('both', 'max'):
+        upper = [EXTENDED_LEVEL]
+    return np.r_[lower, levels, upper]
+
+
+@timed('geojson')
+def _to_geojson_feature(geometry_type, coordinates, properties):
+    geometry = GEOMETRY_TYPES[geometry_type](coordinates=_tolist(coordinates))
+    return Feature(geometry=geometry, properties=properties)
+
+
+def _tolist(coordinates):
+    if isinstance(coordinates, np.ndarray):
+        return coordinates.tolist()
+    return [_tolist(item) for item in coordinates]
+
+
+def _feature_ndigits(ndigits, serialize):
+    """Return the ndigits to round the features to, quantized serialization rounds all vertices itself."""
+    return None if serialize == SERIALIZE_QUANTIZED else ndigits
+
+
+def _render(features, stats, geojson_filepath, strdump, serialize, ndigits, output_format):
+    with collect_stats(stats) as active:
+        if active is None:
+            return _render_feature_collection(features, geojson_filepath, strdump, serialize, ndigits, output_format)
+        result = _render_feature_collection(count_features(features, active), geojson_filepath, strdump, serialize,
+                                            ndigits, output_format)
+        count_output(active, result, geojson_filepath)
+        return result
+
+
+def _render_feature_collection(features, geojson_filepath, strdump, serialize, ndigits=None,
+                               output_format=OUTPUT_GEOJSON):
     if not serialize:
-        return feature_collection
+        return FeatureCollection([_to_geojson_feature(*feature) for feature in features])
+    if serialize == SERIALIZE_ARRAYS:
+        return ContourCollection.from_features(features)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format '{output_format}', expected one of {OUTPUT_FORMATS}")
+    if output_format == OUTPUT_TOPOJSON:
+        return _render_topology(features, geojson_filepath, strdump, ndigits)
+    if output_format == OUTPUT_GEOPARQUET:
+        if serialize == SERIALIZE_QUANTIZED:
+            raise ValueError("serialize='quantized' does not apply to output_format 'geoparquet'")
+        return _render_geoparquet(features, geojson_filepath, strdump)
     if strdump or not geojson_filepath:
-        return geojson.dumps(feature_collection, sort_keys=True, separators=(',', ':'))
-    with open(geojson_filepath, 'w') as fileout:
-        geojson.dump(feature_collection, fileout, sort_keys=True, separators=(',', ':'))
+        if output_format == OUTPUT_GEOJSON and serialize not in (SERIALIZE_FAST, SERIALIZE_QUANTIZED):
+            feature_collection = FeatureCollection([_to_geojson_feature(*feature) for feature in features])
+            return geojson.dumps(feature_collection, sort_keys=True, separators=(',', ':'))
+        buffer = io.StringIO()
+        _write_features(_feature_strings(features, serialize, ndigits, ensure_ascii=False), buffer, output_format)
+        return buffer.getvalue()
+    # geojson.dump escapes non-ASCII characters in files, geojson.dumps does not
+    feature_strings = _feature_strings(features, serialize, ndigits, ensure_ascii=True)
+    if hasattr(geojson_filepath, 'write'):
+        _write_features(feature_strings, geojson_filepath, output_format, flush=True)
+        return
+    # The features are created while writing, an error must not leave a partial file
+    with replace_on_success(geojson_filepath) as fileout:
+        _write_features(feature_strings, fileout, output_format)
+
+
+def _render_topology(features, geojson_filepath, strdump, ndigits):
+    if strdump or not geojson_filepath:
+        return topology_to_str(features, ndigits)
+    topology_string = topology_to_str(features, ndigits, ensure_ascii=True)
+    if hasattr(geojson_filepath, 'write'):
+        text_writer(geojson_filepath)(topology_string)
+        return
+    with replace_on_success(geojson_filepath) as fileout:
+        fileout.write(topology_string)
+
+
+def _render_geoparquet(features, geojson_filepath, strdump):
+    collection = ContourCollection.from_features(features)
+    if strdump or not geojson_filepath:
+        buffer = io.BytesIO()
+        collection.to_parquet(buffer)
+        return buffer.getvalue()
+    collection.to_parquet(geojson_filepath)
+
+
+def _render_tiles(features, destination, zooms, ndigits, tolerance, buffer):
+    tiles = iter_tiles(features, zooms, tolerance, buffer, ndigits)
+    precision = None if ndigits and ndigits <= GEOJSON_PRECISION else GEOJSON_PRECISION
+    if str(destination).endswith('.mbtiles'):
+        return write_mbtiles(tiles, destination, precision=precision)
+    return write_tile_directory(tiles, destination, precision)
+
+
+def _write_features(feature_strings, fileout, output_format, flush=False):
+    if output_format == OUTPUT_GEOJSON:
+        write_feature_collection(feature_strings, fileout)
+    else:
+        record_separator = RECORD_SEPARATOR if output_format == OUTPUT_GEOJSONSEQ else ''
+        write_feature_sequence(feature_strings, fileout, record_separator, flush)
+
+
+def _feature_strings(features, serialize, ndigits, ensure_ascii):
+    if serialize == SERIALIZE_QUANTIZED:
+        ndigits = GEOJSON_PRECISION if ndigits is None else ndigits
+        for feature in features:
+            feature_string = quantized_feature_to_str(*feature, ndigits, ensure_ascii=ensure_ascii)
+            if feature_string is not None:
+                yield feature_string
+        return
+    if serialize != SERIALIZE_FAST:
+        for feature in features:
+            yield geojson.dumps(_to_geojson_feature(*feature), sort_keys=True, separators=(',', ':'),
+                                ensure_ascii=ensure_ascii)
+        return
+    # geojson objects round coordinates to GEOJSON_PRECISION decimals,
+    # which is a no-op for coordinates that were rounded to fewer
+    precision = None if ndigits and ndigits <= GEOJSON_PRECISION else GEOJSON_PRECISION
+    for feature in features:
+        yield feature_to_str(*feature, precision=precision, ensure_ascii=ensure_ascii)
@@ -0,0 +1,149 @@
+"""Contour a grid in chunks and re-contour only the chunks that changed."""
+
+import numpy as np
+
+from .contour import OUTPUT_GEOJSON, _extended_levels, _layer_colors, _layer_lowers, _line_features
+from .contour import _array_contour_generator, _generator_lines
+from .contour import _contourf_level_labels, _multi_polygon_features, _render_feature_collection, _to_geojson_feature
+from .utilities.multipoly import generator_polygon_rings
+
+
+class IncrementalContours:
+    """Filled contours or contour lines of a grid that can be updated in parts.
+
+    The grid is contoured in chunks of chunk_size quads, like
+    array_to_geojson with chunk_size, and the polygons or lines of every
+    chunk are kept. update() re-contours only the chunks that overlap
+    the changed region and stitches them together with the kept chunks.
+    The other arguments are the same as for array_to_geojson.
+    """
+
+    def __init__(self, x, y, z, levels, chunk_size, filled=True, min_angle_deg=None, ndigits=5, unit='',
+                 stroke_width=1, fill_opacity=.9, fill_opacity_range=None, geojson_properties=None,
+                 simplify=None, simplify_tolerance=0.0, cmap='viridis', extend='neither', min_area=None,
+                 algorithm=None):
+        self.z = _grid_values(z)
+        ny, nx = self.z.shape
+        self.x, self.y = _grid_coordinates(x, y, self.z.shape)
+        self.levels = np.asarray(levels, dtype=float)
+        self.filled = filled
+        self.min_angle_deg = min_angle_deg
+        self.ndigits = ndigits
+        self.unit = unit
+        self.stroke_width = stroke_width
+        self.fill_opacity = fill_opacity
+        self.fill_opacity_range = fill_opacity_range
+        self.geojson_properties = geojson_properties
+        self.simplify = simplify
+        self.simplify_tolerance = simplify_tolerance
+        self.min_area = min_area
+        self.algorithm = algorithm
+        self.extend = extend
+        self.bounds = _extended_levels(self.levels, extend) if filled else self.levels
+        self.colors = _layer_colors(self.levels, self.bounds, filled, cmap)
+        self.lowers = _layer_lowers(self.bounds, self.z) if filled else None
+        chunk_rows, chunk_cols = (chunk_size, chunk_size) if np.isscalar(chunk_size) else chunk_size
+        # Neighbouring chunks share the grid points on their boundary
+        self.row_starts = np.arange(0, max(ny - 1, 1), chunk_rows)
+        self.col_starts = np.arange(0, max(nx - 1, 1), chunk_cols)
+        self.row_stops = np.minimum(self.row_starts + chunk_rows, ny - 1) + 1
+        self.col_stops = np.minimum(self.col_starts + chunk_cols, nx - 1) + 1
+        self.chunk_bboxes = np.array([self._chunk_bbox(chunk) for chunk in self.chunks()])
+        self.chunk_layers = {chunk: self._contour_chunk(chunk) for chunk in self.chunks()}
+
+    def chunks(self):
+        """Return the (row, column) index of every chunk."""
+        return [(row, col) for row in range(len(self.row_starts)) for col in range(len(self.col_starts))]
+
+    def update(self, z, bbox=None):
+        """Replace the grid values by z and re-contour the changed chunks, return their number.
+
+        bbox is the (xmin, ymin, xmax, ymax) region that changed. Without
+        it the chunks in which any value differs from the previous grid
+        are re-contoured. If the changed values move the lowest layer
+        bound, like matplotlib does for the grid minimum, all chunks are.
+        """
+        z = _grid_values(z)
+        if z.shape != self.z.shape:
+            raise ValueError(f"Expected a grid of shape {self.z.shape}, got {z.shape}")
+        chunks = self.chunks()
+        if bbox is not None:
+            xmin, ymin, xmax, ymax = bbox
+            overlaps = ((self.chunk_bboxes[:, 0] <= xmax) & (self.chunk_bboxes[:, 2] >= xmin) &
+                        (self.chunk_bboxes[:, 1] <= ymax) & (self.chunk_bboxes[:, 3] >= ymin))
+        else:
+            differs = ~((z == self.z) | (np.isnan(z) & np.isnan(self.z)))
+            overlaps = np.array([np.any(differs[self._chunk_slices(chunk)]) for chunk in chunks], dtype=bool)
+        self.z = z
+        if self.filled:
+            lowers = _layer_lowers(self.bounds, z)
+            if not np.array_equal(lowers, self.lowers):
+                self.lowers = lowers
+                overlaps[:] = True
+        changed = [chunk for chunk, overlap in zip(chunks, overlaps) if overlap]
+        for chunk in changed:
+            self.chunk_layers[chunk] = self._contour_chunk(chunk)
+        return len(changed)
+
+    def features(self):
+        """Yield the (geometry_type, coordinates, properties) features of all chunks."""
+        chunks = self.chunks()
+        if not self.filled:
+            for layer in range(len(self.levels)):
+                for chunk in chunks:
+                    yield from self.chunk_layers[chunk][layer]
+            return
+        level_polygons = ([polygon for chunk in chunks for polygon in self.chunk_layers[chunk][layer]]
+                          for layer in range(len(self.lowers)))
+        contourf_levels = _contourf_level_labels(tuple(self.levels), self.extend)
+        yield from _multi_polygon_features(level_polygons, contourf_levels, self.colors, len(self.levels),
+                                           self.unit, self.stroke_width, self.fill_opacity, self.fill_opacity_range,
+                                           self.geojson_properties)
+
+    def iter_features(self):
+        """Yield the geojson Features one at a time."""
+        for feature in self.features():
+            yield _to_geojson_feature(*feature)
+
+    def to_geojson(self, geojson_filepath=None, strdump=False, serialize=True, output_format=OUTPUT_GEOJSON):
+        """Return or write the features like array_to_geojson."""
+        return _render_feature_collection(self.features(), geojson_filepath, strdump, serialize, self.ndigits,
+                                          output_format)
+
+    def _chunk_slices(self, chunk):
+        row, col = chunk
+        return (slice(self.row_starts[row], self.row_stops[row]),
+                slice(self.col_starts[col], self.col_stops[col]))
+
+    def _chunk_bbox(self, chunk):
+        slices = self._chunk_slices(chunk)
+        x, y = self.x[slices], self.y[slices]
+        return x.min(), y.min(), x.max(), y.max()
+
+    def _contour_chunk(self, chunk):
+        """Return the polygons, or the line features, of every layer of a chunk."""
+        slices = self._chunk_slices(chunk)
+        generator = _array_contour_generator(self.x[slices], self.y[slices], self.z[slices], self.algorithm)
+        if not self.filled:
+            return [list(_line_features(_generator_lines(generator, level), color, level, contour_index,
+                                        self.min_angle_deg, self.ndigits, self.unit, self.stroke_width,
+                                        self.geojson_properties, self.simplify, self.simplify_tolerance))
+                    for contour_index, (level, color) in enumerate(zip(self.levels, self.colors))]
+        return [generator_polygon_rings(generator, lower, upper, self.min_angle_deg, self.ndigits,
+                                        self.simplify, self.simplify_tolerance, self.min_area)
+                for lower, upper in zip(self.lowers, self.bounds[1:])]
+
+
+def _grid_values(z):
+    """Return a float copy of z with masked and invalid values as NaN, which are not contoured."""
+    return np.ma.filled(np.ma.masked_invalid(z).astype(float), np.nan)
+
+
+def _grid_coordinates(x, y, shape):
+    """Return x and y as 2-D arrays of the grid shape."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if x.ndim == 1:
+        x = np.broadcast_to(x, shape)
+    if y.ndim == 1:
+        y = np.broadcast_to(y[:, np.newaxis], shape)
+    return x, y
@@ -0,0 +1,92 @@
+"""Write contour features as GeoArrow arrays and GeoParquet files."""
+import json
+
+import numpy as np
+
+GEOPARQUET_VERSION = '1.1.0'
+
+GEOARROW_ENCODINGS = {
+    'LineString': 'linestring',
+    'Polygon': 'polygon',
+    'MultiPolygon': 'multipolygon',
+}
+
+
+def import_pyarrow():
+    """Return the pyarrow module, with a helpful message if it is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as error:
+        raise ImportError('GeoArrow and GeoParquet output require pyarrow, '
+                          'install it with pip install geojsoncontour[arrow]') from error
+    return pyarrow
+
+
+def geoarrow_array(geometry_type, coordinates, offsets):
+    """Return the native GeoArrow array of a ragged array, without copying the coordinates.
+
+    The coordinates are interleaved x, y and offsets go from the
+    coordinates outwards, as returned by ContourCollection.ragged_array.
+    """
+    pa = import_pyarrow()
+    xy = pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(coordinates, dtype=float).ravel()),
+                                           type=pa.list_(pa.field('xy', pa.float64(), nullable=False), 2))
+    names = {
+        'LineString': ['vertices'],
+        'Polygon': ['vertices', 'rings'],
+        'MultiPolygon': ['vertices', 'rings', 'polygons'],
+    }[geometry_type]
+    array = xy
+    for name, offset in zip(names, offsets):
+        # GeoArrow uses 32-bit offsets unless the array is too large for them
+        large = offset[-1] > np.iinfo(np.int32).max
+        list_type = pa.large_list if large else pa.list_
+        offset = pa.array(offset.astype(np.int64 if large else np.int32, copy=False))
+        array_type = list_type(pa.field(name, array.type, nullable=False))
+        array = (pa.LargeListArray if large else pa.ListArray).from_arrays(offset, array, type=array_type)
+    return array
+
+
+def collection_to_table(collection, geometry_column='geometry'):
+    """Return the features of a ContourCollection as pyarrow Table with GeoParquet metadata.
+
+    The geometries are stored as native GeoArrow array and every
+    property, like level-value, level-index, title, stroke and fill, as
+    a column.
+    """
+    pa = import_pyarrow()
+    geometry_type, coordinates, offsets = collection.ragged_array()
+    encoding = GEOARROW_ENCODINGS[geometry_type]
+    geometries = geoarrow_array(geometry_type, coordinates, offsets)
+    field = pa.field(geometry_column, geometries.type, metadata={
+        'ARROW:extension:name': f'geoarrow.{encoding}',
+        'ARROW:extension:metadata': '{}',
+    })
+    columns = {name: pa.array(values) for name, values in collection.properties.items()}
+    fields = [field] + [pa.field(name, column.type) for name, column in columns.items()]
+    geo = {
+        'version': GEOPARQUET_VERSION,
+        'primary_column': geometry_column,
+        'columns': {
+            geometry_column: {
+                'encoding': encoding,
+                'geometry_types': [geometry_type] if len(collection) else [],
+                'bbox': _bbox(coordinates),
+            },
+        },
+    }
+    schema = pa.schema(fields, metadata={'geo': json.dumps(geo)})
+    return pa.Table.from_arrays([geometries] + list(columns.values()), schema=schema)
+
+
+def write_geoparquet(table, where):
+    """Write a table from collection_to_table to a GeoParquet file path or binary file object."""
+    pa = import_pyarrow()
+    pa.parquet.write_table(table, where)
+
+
+def _bbox(coordinates):
+    if not len(coordinates):
+        return []
+    return [*np.nanmin(coordinates, axis=0).tolist(), *np.nanmax(coordinates, axis=0).tolist()]
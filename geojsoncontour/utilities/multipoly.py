@@ -1,19 +1,28 @@
 #!/usr/bin/python3.4
 # -*- encoding: utf-8 -*-
 """Helper module for transformation of matplotlib.contour(f) to GeoJSON."""
+import collections
 import enum
 
+import contourpy
+from contourpy import FillType
 from geojson import MultiPolygon
 import numpy as np
 
+from .simplify import simplify_polygon
+from .stats import timed
 from .vertices import get_vertices_from_path
 
 
 class Orientation(enum.IntEnum):
     CW = enum.auto()
     CCW = enum.auto()
+
+
+RingMetrics = collections.namedtuple('RingMetrics', ['area', 'orientation', 'bbox', 'n_vertices'])
     
 
+@timed('orientation')
 def orientation(vertices) -> Orientation:
     """Determine orientation for a closed polygon
 
@@ -39,34 +48,162 @@ def orientation(vertices) -> Orientation:
         return Orientation.CW
 
 
-def multi_polygon(path, min_angle_deg, ndigits):
+@timed('orientation')
+def ring_metrics(points, offsets) -> RingMetrics:
+    """Return the metrics of all rings points[offsets[i]:offsets[i + 1]] at once.
+
+    area is the signed area of the shoelace formula, positive for CCW
+    rings, orientation the Orientation of each ring, bbox the (xmin,
+    ymin, xmax, ymax) of each ring (nan for empty rings) and n_vertices
+    the number of vertices. Rings can be closed or open. The metrics are
+    computed in one pass over points, without a loop over the rings.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    starts = offsets[:-1]
+    n_vertices = np.diff(offsets)
+    area = np.zeros(len(n_vertices))
+    bbox = np.full((len(n_vertices), 4), np.nan)
+    nonempty = n_vertices > 0
+    if np.any(nonempty):
+        points = points[offsets[0]:offsets[-1]]
+        starts = starts[nonempty] - offsets[0]
+        counts = n_vertices[nonempty]
+        # Relative to the first vertex of each ring, for precision far from the origin
+        relative = points - np.repeat(points[starts], counts, axis=0)
+        # The vertex that follows each vertex, the last of a ring is followed by the first
+        following = np.arange(1, len(points) + 1)
+        following[starts + counts - 1] = starts
+        cross = relative[:, 0] * relative[following, 1] - relative[following, 0] * relative[:, 1]
+        area[nonempty] = 0.5 * np.add.reduceat(cross, starts)
+        bbox[nonempty, :2] = np.minimum.reduceat(points, starts, axis=0)
+        bbox[nonempty, 2:] = np.maximum.reduceat(points, starts, axis=0)
+    orientations = np.where(area > 0, Orientation.CCW, Orientation.CW)
+    return RingMetrics(area, orientations, bbox, n_vertices)
+
+
+def multi_polygon(path, min_angle_deg, ndigits, simplify=None, simplify_tolerance=0.0):
+    polygons = multi_polygon_rings(path, min_angle_deg, ndigits, simplify, simplify_tolerance)
+    return MultiPolygon(coordinates=[[ring.tolist() for ring in rings] for rings in polygons])
+
+
+def multi_polygon_rings(path, min_angle_deg, ndigits, simplify=None, simplify_tolerance=0.0, min_area=None):
+    """Return the polygons of path as lists of vertex arrays, shell first.
+
+    Rings with an absolute area below min_area are dropped, shells with
+    their holes.
+    """
     # It seems matplotlib emits polygons in either CW or CCW order.
     # We detect which order the first polygon has, and uses this
     # as the ring, with polygons of the other winding order as
     # holes. If order is reversed compared to the conventions,
     # we reverse the order of the polygon so rings have CCW order.
-    orientation_for_keep = None
+    rings = path.to_polygons()
+    if min_angle_deg:
+        rings = [keep_high_angle(ring, min_angle_deg) for ring in rings]
+    if not rings:
+        return []
+    points, offsets = concatenate_rings(rings)
+    if ndigits:
+        points = np.around(points, ndigits)
+    metrics = ring_metrics(points, offsets)
+    orientations = metrics.orientation.tolist()
+    keep = _keep_area(metrics, min_area)
+    offsets = offsets.tolist()
+    orientation_for_keep = orientations[0]
     polygons = []
-    for linestring in path.to_polygons():
-        if min_angle_deg:
-            linestring = keep_high_angle(linestring, min_angle_deg)
-        if ndigits:
-            linestring = np.around(linestring, ndigits)
-
-        handedness = orientation(linestring)
-        if len(polygons) == 0:
-            orientation_for_keep = handedness
+    for index, handedness in enumerate(orientations):
+        linestring = points[offsets[index]:offsets[index + 1]]
         if orientation_for_keep != Orientation.CCW:
             linestring = linestring[::-1, :]
-
         if handedness == orientation_for_keep:
-            polygons.append([linestring.tolist()])
-        else:
+            polygons.append([linestring] if keep[index] else None)
+        elif polygons[-1] is not None and keep[index]:
             # This is a hole, which we assume belong
             # to the previous polygon
-            polygons[-1].extend([linestring.tolist()])
+            polygons[-1].append(linestring)
+    polygons = [rings for rings in polygons if rings is not None]
+
+    if simplify:
+        polygons = [simplify_polygon(rings, simplify, simplify_tolerance) for rings in polygons]
+        polygons = [rings for rings in polygons if rings is not None]
+    return polygons
+
+
+def filled_polygon_rings(points, offsets, min_angle_deg, ndigits, simplify=None, simplify_tolerance=0.0,
+                         min_area=None):
+    """Return the polygons of contourpy OuterOffset output as lists of vertex arrays, shell first.
+
+    contourpy already separates the polygons, each with its outer ring
+    followed by its holes, so no hole assignment is needed. The rings of
+    all polygons are rounded and measured at once. Rings with an
+    absolute area below min_area are dropped, shells with their holes.
+    """
+    if not len(points):
+        return []
+    polygon_offsets = np.zeros(len(offsets) + 1, dtype=np.intp)
+    np.cumsum([len(ring_starts) - 1 for ring_starts in offsets], out=polygon_offsets[1:])
+    ring_offsets = _global_offsets(points, offsets)
+    points = np.concatenate(points)
+    # Degenerate rings, also dropped by Path.to_polygons
+    keep = np.diff(ring_offsets) >= 3
+    if min_angle_deg:
+        points, ring_offsets = concatenate_rings([
+            keep_high_angle(points[start:stop], min_angle_deg)
+            for start, stop in zip(ring_offsets[:-1], ring_offsets[1:])])
+    if ndigits:
+        points = np.around(points, ndigits)
+    metrics = ring_metrics(points, ring_offsets)
+    keep = (keep & _keep_area(metrics, min_area)).tolist()
+    # Holes have the opposite orientation of the shell
+    reverse = (metrics.orientation != Orientation.CCW).tolist()
+    ring_offsets = ring_offsets.tolist()
+    polygons = []
+    for first, last in zip(polygon_offsets[:-1].tolist(), polygon_offsets[1:].tolist()):
+        if not keep[first]:
+            continue
+        rings = [points[ring_offsets[index]:ring_offsets[index + 1]] for index in range(first, last) if keep[index]]
+        if reverse[first]:
+            rings = [ring[::-1, :] for ring in rings]
+        if simplify:
+            rings = simplify_polygon(rings, simplify, simplify_tolerance)
+            if rings is None:
+                continue
+        polygons.append(rings)
+    return polygons
+
+
+def generator_polygon_rings(generator, lower, upper, min_angle_deg, ndigits, simplify=None, simplify_tolerance=0.0,
+                            min_area=None):
+    """Return the polygons between lower and upper of a contourpy generator, see filled_polygon_rings."""
+    filled = generator.filled(lower, upper)
+    points, offsets = contourpy.convert_filled(filled, generator.fill_type, FillType.OuterOffset)
+    return filled_polygon_rings(points, offsets, min_angle_deg, ndigits, simplify, simplify_tolerance, min_area)
+
+
+def concatenate_rings(rings):
+    """Return the vertices of all rings in one array, and the offsets of the rings."""
+    offsets = np.zeros(len(rings) + 1, dtype=np.intp)
+    np.cumsum([len(ring) for ring in rings], out=offsets[1:])
+    return np.concatenate(rings), offsets
 
-    return MultiPolygon(coordinates=polygons)
+
+def _global_offsets(points, offsets):
+    """Return the ring offsets of contourpy OuterOffset output in the concatenated points."""
+    lengths = [len(polygon_offsets) for polygon_offsets in offsets]
+    starts = np.zeros(len(points), dtype=np.intp)
+    np.cumsum([len(polygon_points) for polygon_points in points[:-1]], out=starts[1:])
+    ring_offsets = np.concatenate(offsets) + np.repeat(starts, lengths)
+    # The end of each polygon is the start of the next
+    ends = np.cumsum(lengths) - 1
+    return np.append(np.delete(ring_offsets, ends), ring_offsets[-1])
+
+
+def _keep_area(metrics, min_area):
+    """Return which rings have an absolute area of at least min_area."""
+    if not min_area:
+        return np.ones(len(metrics.area), dtype=bool)
+    return np.abs(metrics.area) >= min_area
 
 
 def unit_vector(vector):
@@ -81,20 +218,41 @@ def angle(v1, v2):
     return np.arccos(np.clip(np.dot(v1_u, v2_u), -1.0, 1.0))
 
 
+@timed('keep_high_angle')
 def keep_high_angle(vertices, min_angle_deg):
-    """Keep vertices with angles higher then given minimum."""
-    accepted = []
+    """Keep vertices with angles higher then given minimum.
+
+    Vertex i is kept if the angle between v[i + 1] - v[i - 1] and the
+    segment ending at the last kept vertex exceeds min_angle_deg. The
+    directions of all segments are computed at once with numpy, which
+    leaves only a scan over plain floats to find the kept vertices.
+    """
     v = vertices
-    v1 = v[1] - v[0]
-    accepted.append((v[0][0], v[0][1]))
-    for i in range(1, len(v) - 2):
-        v2 = v[i + 1] - v[i - 1]
-        diff_angle = np.fabs(angle(v1, v2) * 180.0 / np.pi)
-        if diff_angle > min_angle_deg:
-            accepted.append((v[i][0], v[i][1]))
-            v1 = v[i] - v[i - 1]
-    accepted.append((v[-1][0], v[-1][1]))
-    return np.array(accepted, dtype=vertices.dtype)
+    keep = [0]
+    if len(v) > 3:
+        segments = v[1:] - v[:-1]
+        candidates = v[2:-1] - v[:-3]
+        segment_angles = _direction_deg(segments)
+        candidate_angles = _direction_deg(candidates)
+        # The angle between two vectors is undefined if either has zero length
+        segment_angles[~np.any(segments, axis=1)] = np.nan
+        candidate_angles[~np.any(candidates, axis=1)] = np.nan
+        segment_angles = segment_angles.tolist()
+        reference = segment_angles[0]
+        for i, candidate in enumerate(candidate_angles.tolist(), start=1):
+            diff_angle = abs(candidate - reference)
+            if diff_angle > 180.0:
+                diff_angle = 360.0 - diff_angle
+            if diff_angle > min_angle_deg:
+                keep.append(i)
+                reference = segment_angles[i - 1]
+    keep.append(len(v) - 1)
+    return np.array(v[keep], dtype=vertices.dtype)
+
+
+def _direction_deg(vectors):
+    """Return the direction of each vector in degrees."""
+    return np.degrees(np.arctan2(vectors[:, 1], vectors[:, 0]))
 
 
 def set_contourf_properties(stroke_width, fcolor, fill_opacity, level, unit):
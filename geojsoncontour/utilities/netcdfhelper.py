@@ -3,11 +3,12 @@
 """Helper module for transformation of netCDF to GeoJSON."""
 
 import xarray as xr
-from matplotlib import pyplot as plt
 import numpy as np
 import geojsoncontour
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 
 def load(ncfile):
@@ -25,48 +26,149 @@ def get_lat_lon_vars(ncdataset):
                 )]
 
 
-def setup(filename, var):
+def setup(filename, var, memory_budget=None, meshgrid=True):
+    """Open filename and return X, Y, Z, the 20 levels between the extremes of var and its unit.
+
+    Z is the lazily loaded variable. The extremes are reduced over slabs
+    of consecutive timesteps of at most memory_budget bytes (one timestep
+    if None), so the whole variable is never loaded at once. With
+    meshgrid=False, X and Y are the 1-D lon and lat coordinates, which
+    the contouring functions accept as well.
+    """
     data = xr.open_dataset(filename)
     lon_range = data.variables['lon'].data
     lat_range = data.variables['lat'].data
-    lon_range, lat_range
-    X, Y = np.meshgrid(lon_range, lat_range)
-    mini = np.nanmin(data.variables[var].data)
-    maxi = np.nanmax(data.variables[var].data)
+    if meshgrid:
+        X, Y = np.meshgrid(lon_range, lat_range)
+    else:
+        X, Y = lon_range, lat_range
+    Z = getattr(data, var)
+    mini, maxi = nanminmax(Z, memory_budget)
     unit = data.variables[var].attrs['units']
     n_contours = 20
     levels = np.linspace(start=mini, stop=maxi, num=n_contours)
-    Z = getattr(data, var)
     return X, Y, Z, levels, unit
 
 
-def netcdf_to_geojson(ncfile, var, fourth_dim=None):
+def nanminmax(variable, memory_budget=None):
+    """Return the minimum and maximum of variable ignoring NaN, reading one slab at a time."""
+    mini, maxi = np.nan, np.nan
+    for values in iter_slabs(variable, range(variable.sizes['time']), memory_budget):
+        mini = np.fmin(mini, np.nanmin(values))
+        maxi = np.fmax(maxi, np.nanmax(values))
+    return mini, maxi
+
+
+def iter_slabs(variable, timesteps, memory_budget=None):
+    """Yield the values of variable for slabs of consecutive timesteps.
+
+    A slab holds as many timesteps as fit in memory_budget bytes, but at
+    least one. Without a memory_budget every slab is a single timestep.
+    """
+    timesteps = np.asarray(timesteps, dtype=int)
+    n_slab = 1
+    if memory_budget:
+        timestep_bytes = variable.dtype.itemsize * variable.size // max(variable.sizes['time'], 1)
+        n_slab = max(1, int(memory_budget // max(timestep_bytes, 1)))
+    for start in range(0, len(timesteps), n_slab):
+        yield variable.isel(time=timesteps[start:start + n_slab]).values
+
+
+def netcdf_to_geojson(ncfile, var, fourth_dim=None, workers=1, memory_budget=None):
+    """Write a geojson file with filled contours for each timestep of var.
+
+    With workers > 1 the timesteps are split into contiguous shards that
+    are converted in a pool of processes. Each process opens the dataset
+    itself, which only reads the timesteps it converts, and writes the
+    same files as the serial conversion.
+
+    The timesteps are read lazily in slabs of at most memory_budget bytes,
+    see iter_slabs, so by default only one timestep per process is loaded.
+    """
     realpath = os.path.realpath(ncfile)
     name, ext = os.path.splitext(realpath)
-    X, Y, Z, levels, unit = setup(ncfile, var)
-    figure = plt.figure()
-    ax = figure.add_subplot(111)
-    for t in range(len(Z.time)):
-        third = Z.isel(time=t)
-        position = 0
-        if len(third.dims) == 3:
-            position = len(getattr(third, third.dims[0]))-1
-            third = third[position, ]
-        # local min max
-        levels = np.linspace(start=np.nanmin(third),
-                             stop=np.nanmax(third), num=20)
-        contourf = ax.contourf(X, Y, third, levels=levels, cmap=plt.cm.viridis)
-        geojsoncontour.contourf_to_geojson(
-            contourf=contourf,
-            geojson_filepath='{}_{}_t{}_{}.geojson'.format(name, var,
-                                                           t, position),
-            ndigits=3,
-            min_angle_deg=None,
-            unit=unit
-        )
+    with load(ncfile) as data:
+        n_timesteps = len(data.time)
+    if not workers or workers <= 1:
+        timesteps_to_geojson(ncfile, var, name, range(n_timesteps), memory_budget)
+        return
+    shards = [shard for shard in np.array_split(np.arange(n_timesteps), workers) if len(shard)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Consume the results to raise exceptions from the workers
+        list(executor.map(timesteps_to_geojson, repeat(ncfile), repeat(var), repeat(name), shards,
+                          repeat(memory_budget)))
+
+
+# The geojson file written for each timestep, name is the path of the netCDF file without extension
+OUTPUT_PATTERN = '{name}_{var}_t{t}_{position}.geojson'
+
+
+def timesteps_to_geojson(ncfile, var, name, timesteps, memory_budget=None):
+    with load(ncfile) as data:
+        dataset_to_geojson(data, var, name, timesteps, memory_budget)
+
+
+def dataset_to_geojson(data, var, name, timesteps=None, memory_budget=None, levels=20,
+                       output_pattern=OUTPUT_PATTERN, newer_than=None):
+    """Write a geojson file with filled contours for timesteps (all if None) of var in the open dataset data.
+
+    levels is the number of levels between the extremes of each
+    timestep, or a sequence of levels used for all timesteps. The files
+    are named by output_pattern. With newer_than, a modification time,
+    timesteps of which the file was modified at or after it are skipped
+    without reading them. A file is only replaced when its conversion
+    succeeds, so a failed or interrupted conversion never leaves a
+    partial file that is skipped as up to date later. Returns the written
+    and skipped filenames.
+    """
+    lon = data.variables['lon'].data
+    lat = data.variables['lat'].data
+    Z = getattr(data, var)
+    unit = data.variables[var].attrs['units']
+    position = 0
+    if len(Z.dims) == 4:
+        position = Z.sizes[Z.dims[1]] - 1
+        Z = Z.isel({Z.dims[1]: position})
+    if timesteps is None:
+        timesteps = range(Z.sizes['time'])
+    filenames = {int(t): output_pattern.format(name=name, var=var, t=int(t), position=position) for t in timesteps}
+    skipped = {}
+    if newer_than is not None:
+        skipped = {t: filename for t, filename in filenames.items() if _modified_since(filename, newer_than)}
+        timesteps = [t for t in timesteps if int(t) not in skipped]
+    slabs = iter_slabs(Z, timesteps, memory_budget)
+    written = []
+    timesteps = iter(timesteps)
+    for slab in slabs:
+        for values, t in zip(slab, timesteps):
+            if np.ndim(levels) == 0:
+                # local min max
+                timestep_levels = np.linspace(start=np.nanmin(values),
+                                              stop=np.nanmax(values), num=levels)
+            else:
+                timestep_levels = levels
+            filename = filenames[int(t)]
+            geojsoncontour.array_to_geojson(
+                lon, lat, values, timestep_levels,
+                cmap='viridis',
+                geojson_filepath=filename,
+                ndigits=3,
+                min_angle_deg=None,
+                unit=unit
+            )
+            written.append(filename)
+    return written, list(skipped.values())
+
+
+def _modified_since(filename, mtime):
+    try:
+        return os.path.getmtime(filename) >= mtime
+    except OSError:
+        return False
 
 
 if __name__ == '__main__':
     nc = sys.argv[1]
     var = sys.argv[2]
-    netcdf_to_geojson(nc, var)
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    netcdf_to_geojson(nc, var, workers=workers)
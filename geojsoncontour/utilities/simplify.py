@@ -0,0 +1,176 @@
+"""Tolerance based line and polygon simplification."""
+import numpy as np
+
+from .stats import timed
+
+DOUGLAS_PEUCKER = 'douglas-peucker'
+VISVALINGAM = 'visvalingam'
+
+
+@timed('simplify')
+def simplify_line(vertices, method, tolerance):
+    """Simplify a line with the given method, the end points are always kept."""
+    if method == DOUGLAS_PEUCKER:
+        return douglas_peucker(vertices, tolerance)
+    if method == VISVALINGAM:
+        return visvalingam_whyatt(vertices, tolerance)
+    raise ValueError(f"Unknown simplify method '{method}', "
+                     f"expected '{DOUGLAS_PEUCKER}' or '{VISVALINGAM}'")
+
+
+@timed('simplify')
+def simplify_ring(vertices, method, tolerance):
+    """Simplify a closed ring, returns None if the ring collapses."""
+    vertices = simplify_line(vertices, method, tolerance)
+    if len(vertices) < 4:
+        return None
+    return vertices
+
+
+@timed('simplify')
+def simplify_polygon(rings, method, tolerance):
+    """Simplify a shell and its holes without letting holes cross the shell.
+
+    A simplified hole that crosses the simplified shell, or ends up
+    outside of it, is replaced by the original hole. If the original
+    hole also conflicts with the simplified shell, the original shell
+    is used. The original rings never cross, so the result is valid.
+    Returns None if the shell collapses, holes that collapse are dropped.
+    """
+    shell = simplify_ring(rings[0], method, tolerance)
+    if shell is None:
+        return None
+    holes = [simplify_ring(hole, method, tolerance) for hole in rings[1:]]
+    holes, keep_shell = _resolve_holes(shell, holes, rings[1:])
+    if not keep_shell:
+        shell = rings[0]
+        holes, _ = _resolve_holes(shell, holes, rings[1:])
+    return [shell, *[hole for hole in holes if hole is not None]]
+
+
+def _resolve_holes(shell, holes, original_holes):
+    resolved = []
+    keep_shell = True
+    for hole, original in zip(holes, original_holes):
+        if hole is None or not _conflicts(hole, shell):
+            resolved.append(hole)
+            continue
+        resolved.append(original)
+        if _conflicts(original, shell):
+            keep_shell = False
+    return resolved, keep_shell
+
+
+def _conflicts(hole, shell):
+    return rings_cross(hole, shell) or not point_in_ring(hole[0], shell)
+
+
+def douglas_peucker(vertices, tolerance):
+    """Douglas-Peucker simplification.
+
+    All segments that still have vertices further away than tolerance
+    are split at their furthest vertex in the same numpy pass, so the
+    number of passes is the depth of the recursion.
+    """
+    n = len(vertices)
+    if n < 3:
+        return vertices
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    active = np.arange(1, n - 1)
+    while len(active):
+        kept = np.flatnonzero(keep)
+        segment = np.searchsorted(kept, active)
+        dist = segment_distance(vertices[active], vertices[kept[segment - 1]], vertices[kept[segment]])
+        group_starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(active)])
+        group_max = np.maximum.reduceat(dist, group_starts)
+        split = group_max > tolerance
+        if not np.any(split):
+            break
+        group = np.repeat(np.arange(len(group_starts)), group_sizes)
+        is_max = (dist == group_max[group]) & split[group]
+        max_indices = np.flatnonzero(is_max)
+        _, first = np.unique(group[max_indices], return_index=True)
+        chosen = max_indices[first]
+        keep[active[chosen]] = True
+        remaining = split[group]
+        remaining[chosen] = False
+        active = active[remaining]
+    return vertices[keep]
+
+
+def visvalingam_whyatt(vertices, tolerance):
+    """Visvalingam-Whyatt simplification, tolerance is a triangle area.
+
+    Instead of removing one vertex at a time, every round removes every
+    other vertex of each run of vertices with an area below tolerance.
+    The removed vertices are never neighbours, so their areas do not
+    depend on each other and the number of rounds stays small.
+    """
+    indices = np.arange(len(vertices))
+    while len(indices) > 2:
+        v = vertices[indices]
+        below = triangle_area(v[:-2], v[1:-1], v[2:]) < tolerance
+        if not np.any(below):
+            break
+        position = np.arange(len(below))
+        run_start = below & ~np.r_[False, below[:-1]]
+        run_offset = position - np.maximum.accumulate(np.where(run_start, position, 0))
+        remove = below & (run_offset % 2 == 0)
+        indices = np.r_[indices[0], indices[1:-1][~remove], indices[-1]]
+    return vertices[indices]
+
+
+def triangle_area(a, b, c):
+    """Return the area of each triangle a, b, c."""
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def segment_distance(points, start, end):
+    """Return the distance of each point to the segment from start to end."""
+    direction = end - start
+    length_sq = np.einsum('ij,ij->i', direction, direction)
+    offset = points - start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.einsum('ij,ij->i', offset, direction) / length_sq
+    t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+    return np.hypot(*(offset - t[:, np.newaxis] * direction).T)
+
+
+def rings_cross(a, b, chunk_size=2**20):
+    """Return True if any segment of ring a properly crosses a segment of ring b."""
+    a0, a1 = a[:-1], a[1:]
+    b0, b1 = b[:-1], b[1:]
+    # Only segments of b that overlap the bounding box of a can cross it
+    lower, upper = np.minimum(b0, b1), np.maximum(b0, b1)
+    overlap = np.all((upper >= a.min(axis=0)) & (lower <= a.max(axis=0)), axis=1)
+    b0, b1 = b0[overlap], b1[overlap]
+    if len(b0) == 0:
+        return False
+    rows = max(1, chunk_size // len(b0))
+    for start in range(0, len(a0), rows):
+        p0 = a0[start:start + rows, np.newaxis, :]
+        p1 = a1[start:start + rows, np.newaxis, :]
+        d1 = _cross(b0, b1, p0)
+        d2 = _cross(b0, b1, p1)
+        d3 = _cross(p0, p1, b0)
+        d4 = _cross(p0, p1, b1)
+        if np.any((d1 * d2 < 0) & (d3 * d4 < 0)):
+            return True
+    return False
+
+
+def _cross(o, a, b):
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def point_in_ring(point, ring):
+    """Return True if point lies inside the closed ring (even-odd rule)."""
+    x, y = point
+    x0, y0 = ring[:-1, 0], ring[:-1, 1]
+    x1, y1 = ring[1:, 0], ring[1:, 1]
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(straddles & (x < x_cross)) % 2)
@@ -0,0 +1,136 @@
+"""Optional timing of the stages of a conversion."""
+import collections
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+
+# The ConversionStats of the conversion running in this context and the stage being timed
+_active = contextvars.ContextVar('geojsoncontour_stats', default=(None, None))
+
+
+class ConversionStats:
+    """Wall time per stage and counts of one or more conversions.
+
+    seconds has the 'total' time, the time spent creating the
+    'features', of which 'keep_high_angle', 'orientation' and 'simplify'
+    are part, the time creating 'geojson' objects and the remaining time
+    to 'serialize' and write the output. counts has the number of
+    'features', 'rings' and 'vertices', and the 'output_bytes' of
+    strings and files. Stages of conversions with workers are not timed.
+
+    The same ConversionStats can be passed to concurrent conversions,
+    each conversion is recorded separately and added when it is done.
+    """
+
+    def __init__(self):
+        self.seconds = collections.defaultdict(float)
+        self.counts = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        seconds = {stage: round(value, 6) for stage, value in self.seconds.items()}
+        return f'ConversionStats(seconds={seconds}, counts={dict(self.counts)})'
+
+    def __getstate__(self):
+        return {'seconds': self.seconds, 'counts': self.counts}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, other):
+        """Add the seconds and counts of other."""
+        with self._lock:
+            for stage, value in other.seconds.items():
+                self.seconds[stage] += value
+            for name, value in other.counts.items():
+                self.counts[name] += value
+
+
+def timed(stage):
+    """Add the time of calls to the decorated function to stage of the active ConversionStats.
+
+    Without active stats this costs one context variable lookup. Calls
+    made while another stage is timed are part of that stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats, active_stage = _active.get()
+            if stats is None or active_stage is not None:
+                return function(*args, **kwargs)
+            token = _active.set((stats, stage))
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.seconds[stage] += time.perf_counter() - start
+                _active.reset(token)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def collect_stats(stats):
+    """Activate stats, a ConversionStats or a callback that is called with one, for the enclosed conversion.
+
+    Yields the ConversionStats of this conversion, or None if stats is
+    None. It is only used in the current context, so it is not shared
+    with concurrent conversions, and added to stats at the end.
+    """
+    if stats is None:
+        yield None
+        return
+    active = ConversionStats()
+    token = _active.set((active, None))
+    start = time.perf_counter()
+    try:
+        yield active
+    finally:
+        _active.reset(token)
+        elapsed = time.perf_counter() - start
+        active.seconds['total'] = elapsed
+        active.seconds['serialize'] = elapsed - (active.seconds['features'] + active.seconds['geojson'])
+        if isinstance(stats, ConversionStats):
+            stats.add(active)
+    if not isinstance(stats, ConversionStats):
+        stats(active)
+
+
+def count_features(features, stats):
+    """Yield the (geometry_type, coordinates, properties) features, timing and counting them in stats."""
+    iterator = iter(features)
+    while True:
+        start = time.perf_counter()
+        try:
+            feature = next(iterator)
+        except StopIteration:
+            stats.seconds['features'] += time.perf_counter() - start
+            return
+        stats.seconds['features'] += time.perf_counter() - start
+        rings = _rings(feature[0], feature[1])
+        stats.counts['features'] += 1
+        stats.counts['rings'] += len(rings)
+        stats.counts['vertices'] += sum(len(ring) for ring in rings)
+        yield feature
+
+
+def count_output(stats, result, geojson_filepath):
+    """Add the size of a string or bytes result, or of the written file, to the output_bytes of stats."""
+    if isinstance(result, str):
+        stats.counts['output_bytes'] += len(result.encode('utf-8'))
+    elif isinstance(result, bytes):
+        stats.counts['output_bytes'] += len(result)
+    elif isinstance(geojson_filepath, (str, os.PathLike)):
+        stats.counts['output_bytes'] += os.path.getsize(geojson_filepath)
+
+
+def _rings(geometry_type, coordinates):
+    if geometry_type == 'LineString':
+        return [coordinates]
+    if geometry_type == 'Polygon':
+        return coordinates
+    return [ring for polygon in coordinates for ring in polygon]
@@ -0,0 +1,308 @@
+"""Split contour features into a z/x/y pyramid of clipped slippy map tiles.
+
+Coordinates are longitude and latitude, tiles follow the XYZ scheme of
+web mercator maps. Every zoom level is simplified with a tolerance of
+a fraction of a pixel and then clipped down a quadtree: a tile is
+clipped from the geometry of its parent tile, and only the parts whose
+bounding box overlaps the tile are considered.
+"""
+import io
+import math
+import os
+import sqlite3
+
+import numpy as np
+
+from .simplify import DOUGLAS_PEUCKER, simplify_line, simplify_polygon
+from .writer import feature_to_str, write_feature_collection
+
+TILE_SIZE = 256
+
+MBTILES_FORMAT = 'application/geo+json'
+
+
+def tile_bounds(z, x, y, buffer=0.0):
+    """Return the (west, south, east, north) bounds of a tile, extended by buffer pixels."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = _tile_latitude(y, n)
+    south = _tile_latitude(y + 1, n)
+    if buffer:
+        dx = buffer * (east - west) / TILE_SIZE
+        dy = buffer * (north - south) / TILE_SIZE
+        west, south, east, north = west - dx, south - dy, east + dx, north + dy
+    return west, south, east, north
+
+
+def _tile_latitude(y, n):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+
+def iter_tiles(features, zooms, tolerance=1.0, buffer=0.0, ndigits=None):
+    """Yield (z, x, y, features) for every tile of zooms that contains geometry.
+
+    features are (geometry_type, coordinates, properties) tuples of
+    LineStrings, Polygons or MultiPolygons. For every zoom the features
+    are simplified with Douglas-Peucker with a tolerance in pixels of
+    that zoom, starting from the simplified features of the next finer
+    zoom, and clipped to the tiles extended by buffer pixels.
+    Lines split by a tile edge become MultiLineStrings. Coordinates
+    created by clipping are rounded to ndigits.
+    """
+    features = list(features)
+    zoom_parts = {}
+    parts = _feature_parts(features)
+    # Simplify the coarser zooms from the finer ones, which have fewer vertices
+    for z in sorted(set(zooms), reverse=True):
+        pixel_size = 360.0 / (TILE_SIZE * 2 ** z)
+        parts = zoom_parts[z] = _simplified_parts(parts, tolerance * pixel_size)
+    for z in zooms:
+        parts = zoom_parts[z]
+        for x, y, tile_parts in _split(parts, _part_bboxes(parts), 0, 0, 0, z, buffer):
+            yield z, x, y, _tile_features(features, tile_parts, ndigits)
+
+
+def write_tile_directory(tiles, directory, precision=None):
+    """Write each tile as FeatureCollection to directory/z/x/y.geojson, return the number of tiles."""
+    count = 0
+    for z, x, y, features in tiles:
+        tile_directory = os.path.join(directory, str(z), str(x))
+        os.makedirs(tile_directory, exist_ok=True)
+        with open(os.path.join(tile_directory, f'{y}.geojson'), 'w') as fileout:
+            write_feature_collection(_feature_strings(features, precision), fileout)
+        count += 1
+    return count
+
+
+def write_mbtiles(tiles, filepath, name='contours', precision=None):
+    """Write the tiles as GeoJSON blobs to a MBTiles SQLite file, return the number of tiles.
+
+    Like in the MBTiles specification the tile rows are numbered from
+    the south (TMS scheme), an existing file is replaced.
+    """
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    count = 0
+    zooms = []
+    with sqlite3.connect(filepath) as connection:
+        connection.execute('CREATE TABLE metadata (name text, value text)')
+        connection.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, '
+                           'tile_row integer, tile_data blob)')
+        connection.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        for z, x, y, features in tiles:
+            buffer = io.StringIO()
+            write_feature_collection(_feature_strings(features, precision), buffer)
+            connection.execute('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                               (z, x, 2 ** z - 1 - y, buffer.getvalue().encode('utf-8')))
+            zooms.append(z)
+            count += 1
+        metadata = {'name': name, 'format': MBTILES_FORMAT, 'type': 'overlay'}
+        if zooms:
+            metadata.update(minzoom=str(min(zooms)), maxzoom=str(max(zooms)))
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+    connection.close()
+    return count
+
+
+def _feature_strings(features, precision):
+    for feature in features:
+        yield feature_to_str(*feature, precision=precision, ensure_ascii=True)
+
+
+def _feature_parts(features):
+    """Return (feature index, line or polygon rings) for every part of the features."""
+    parts = []
+    for index, (geometry_type, coordinates, _) in enumerate(features):
+        if geometry_type in ('LineString', 'Polygon'):
+            parts.append((index, coordinates))
+        else:
+            parts.extend((index, rings) for rings in coordinates)
+    return parts
+
+
+def _simplified_parts(parts, tolerance):
+    if not tolerance:
+        return parts
+    simplified = []
+    for index, geometry in parts:
+        if isinstance(geometry, np.ndarray):
+            geometry = simplify_line(geometry, DOUGLAS_PEUCKER, tolerance)
+        else:
+            geometry = simplify_polygon(geometry, DOUGLAS_PEUCKER, tolerance)
+            if geometry is None:
+                continue
+        simplified.append((index, geometry))
+    return simplified
+
+
+def _part_bboxes(parts):
+    """Return the (xmin, ymin, xmax, ymax) of every part, the shell of polygons."""
+    if not parts:
+        return np.empty((0, 4))
+    outlines = [geometry if isinstance(geometry, np.ndarray) else geometry[0] for _, geometry in parts]
+    starts = np.r_[0, np.cumsum([len(outline) for outline in outlines[:-1]])]
+    vertices = np.concatenate(outlines)
+    return np.hstack([np.minimum.reduceat(vertices, starts), np.maximum.reduceat(vertices, starts)])
+
+
+def _split(parts, bboxes, z, x, y, max_zoom, buffer):
+    """Yield (x, y, parts) for the tiles at max_zoom below tile z/x/y."""
+    west, south, east, north = bounds = tile_bounds(z, x, y, buffer)
+    overlaps = ((bboxes[:, 0] <= east) & (bboxes[:, 2] >= west) &
+                (bboxes[:, 1] <= north) & (bboxes[:, 3] >= south))
+    inside = ((bboxes[:, 0] >= west) & (bboxes[:, 2] <= east) &
+              (bboxes[:, 1] >= south) & (bboxes[:, 3] <= north))
+    tile_parts = []
+    tile_bboxes = []
+    for index in np.flatnonzero(overlaps):
+        if inside[index]:
+            tile_parts.append(parts[index])
+            tile_bboxes.append(bboxes[index])
+            continue
+        feature_index, geometry = parts[index]
+        if isinstance(geometry, np.ndarray):
+            clipped = clip_line(geometry, bounds)
+        else:
+            rings = clip_polygon(geometry, bounds)
+            clipped = [rings] if rings else []
+        for geometry in clipped:
+            tile_parts.append((feature_index, geometry))
+            outline = geometry if isinstance(geometry, np.ndarray) else geometry[0]
+            tile_bboxes.append(np.concatenate([outline.min(axis=0), outline.max(axis=0)]))
+    if not tile_parts:
+        return
+    if z == max_zoom:
+        yield x, y, tile_parts
+        return
+    tile_bboxes = np.array(tile_bboxes)
+    for child_y in (2 * y, 2 * y + 1):
+        for child_x in (2 * x, 2 * x + 1):
+            yield from _split(tile_parts, tile_bboxes, z + 1, child_x, child_y, max_zoom, buffer)
+
+
+def _tile_features(features, tile_parts, ndigits):
+    """Group the clipped parts by feature, in the order of the features."""
+    geometries = {}
+    for feature_index, geometry in tile_parts:
+        if ndigits:
+            geometry = _around(geometry, ndigits)
+        geometries.setdefault(feature_index, []).append(geometry)
+    tile_features = []
+    for feature_index in sorted(geometries):
+        geometry_type, _, properties = features[feature_index]
+        parts = geometries[feature_index]
+        if geometry_type == 'LineString' and len(parts) > 1:
+            geometry_type = 'MultiLineString'
+        elif geometry_type in ('LineString', 'Polygon'):
+            parts = parts[0]
+        tile_features.append((geometry_type, parts, properties))
+    return tile_features
+
+
+def _around(geometry, ndigits):
+    if isinstance(geometry, np.ndarray):
+        return np.around(geometry, ndigits)
+    return [np.around(ring, ndigits) for ring in geometry]
+
+
+def clip_polygon(rings, bounds):
+    """Clip the shell and holes of a polygon to bounds, returns [] if the shell falls outside."""
+    clipped = []
+    for ring in rings:
+        ring = clip_ring(ring, bounds)
+        if ring is None:
+            if not clipped:
+                return []
+            continue
+        clipped.append(ring)
+    return clipped
+
+
+def clip_ring(ring, bounds):
+    """Clip a closed ring to the (west, south, east, north) bounds with Sutherland-Hodgman.
+
+    Every edge of the rectangle is handled in one numpy pass over all
+    vertices. Parts of the ring outside bounds are replaced by parts of
+    the tile edge. Returns None if less than three vertices remain.
+    """
+    points = ring[:-1]
+    lower, upper = points.min(axis=0), points.max(axis=0)
+    for axis, limit, keep_greater in _half_planes(bounds):
+        # Skip the half planes that contain the whole ring
+        if (lower[axis] >= limit) if keep_greater else (upper[axis] <= limit):
+            continue
+        if (upper[axis] < limit) if keep_greater else (lower[axis] > limit):
+            return None
+        inside = points[:, axis] >= limit if keep_greater else points[:, axis] <= limit
+        following = np.concatenate([points[1:], points[:1]])
+        following_inside = np.concatenate([inside[1:], inside[:1]])
+        crossing = inside != following_inside
+        # Every edge adds its intersection with the half plane if it
+        # crosses it, and its end point if that is inside
+        candidates = np.empty((2 * len(points), 2))
+        candidates[0::2] = _intersect(points, following, axis, limit)
+        candidates[1::2] = following
+        emitted = np.empty(2 * len(points), dtype=bool)
+        emitted[0::2] = crossing
+        emitted[1::2] = following_inside
+        points = _drop_duplicates(candidates[emitted])
+        if len(points) < 3:
+            return None
+    if np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    if len(points) < 3:
+        return None
+    return np.vstack([points, points[:1]])
+
+
+def clip_line(line, bounds):
+    """Clip an open line to the (west, south, east, north) bounds, returns the pieces inside."""
+    pieces = [line]
+    for axis, limit, keep_greater in _half_planes(bounds):
+        pieces = [clipped for piece in pieces for clipped in _clip_line_half_plane(piece, axis, limit, keep_greater)]
+    return pieces
+
+
+def _clip_line_half_plane(line, axis, limit, keep_greater):
+    inside = line[:, axis] >= limit if keep_greater else line[:, axis] <= limit
+    if np.all(inside):
+        return [line]
+    if not np.any(inside[:-1] | inside[1:]):
+        return []
+    crossing = inside[:-1] != inside[1:]
+    intersections = _intersect(line[:-1], line[1:], axis, limit)
+    candidates = np.vstack([line[:1], np.stack([intersections, line[1:]], axis=1).reshape(-1, 2)])
+    emitted = np.r_[inside[0], np.stack([crossing, inside[1:]], axis=1).ravel()]
+    # A new piece starts after every edge that leaves the half plane
+    leaving = crossing & inside[:-1]
+    piece = np.r_[0, np.repeat(np.cumsum(leaving) - leaving, 2)]
+    points, piece = candidates[emitted], piece[emitted]
+    splits = np.flatnonzero(piece[1:] != piece[:-1]) + 1
+    pieces = [_drop_duplicates(points) for points in np.split(points, splits)]
+    return [points for points in pieces if len(points) > 1]
+
+
+def _half_planes(bounds):
+    west, south, east, north = bounds
+    return (0, west, True), (0, east, False), (1, south, True), (1, north, False)
+
+
+def _intersect(start, end, axis, limit):
+    """Return the points where the segments from start to end cross axis == limit."""
+    delta = end[:, axis] - start[:, axis]
+    parallel = delta == 0
+    # Edges that do not cross are never used, clip them to keep the values finite
+    t = np.clip((limit - start[:, axis]) / np.where(parallel, 1.0, delta), 0.0, 1.0)
+    intersections = start + t[:, np.newaxis] * (end - start)
+    intersections[:, axis] = limit
+    return intersections
+
+
+def _drop_duplicates(points):
+    if len(points) < 2:
+        return points
+    keep = np.empty(len(points), dtype=bool)
+    keep[0] = True
+    np.any(points[1:] != points[:-1], axis=1, out=keep[1:])
+    return points[keep]
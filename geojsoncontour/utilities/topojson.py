@@ -0,0 +1,158 @@
+"""Build a TopoJSON topology with shared, quantized and delta-encoded arcs.
+
+See https://github.com/topojson/topojson-specification for the format.
+"""
+import json
+
+import numpy as np
+
+OBJECT_NAME = 'contours'
+
+
+def topology(features, ndigits=None):
+    """Return a TopoJSON Topology dict for (geometry_type, coordinates, properties) features.
+
+    Coordinates are quantized to integers with a scale of 10**-ndigits,
+    lines are cut at the points where the rings they share with other
+    rings diverge, and every arc that occurs more than once, in either
+    direction, is only stored once.
+    """
+    features = list(features)
+    scale = 10.0 ** -(ndigits or 6)
+    lines = [line for feature in features for line in _feature_lines(*feature[:2])]
+    minima = [line.min(axis=0) for line in lines if len(line)]
+    if minima:
+        translate = np.around(np.min(minima, axis=0), ndigits or 6)
+    else:
+        translate = np.zeros(2)
+    quantized = [_quantize(line, translate, scale) for line in lines]
+    closed = [np.array_equal(line[0], line[-1]) and len(line) > 1 for line in quantized]
+    arcs = _ArcIndex()
+    line_arcs = [arcs.add_line(line, is_closed, junctions)
+                 for line, is_closed, junctions in zip(quantized, closed, _junctions(quantized, closed))]
+    geometries = []
+    line_arcs = iter(line_arcs)
+    for geometry_type, coordinates, properties in features:
+        geometries.append({
+            'type': geometry_type,
+            'arcs': _nest(geometry_type, coordinates, line_arcs),
+            'properties': properties,
+        })
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [scale, scale], 'translate': translate.tolist()},
+        'objects': {OBJECT_NAME: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs.delta_encoded(),
+    }
+
+
+def topology_to_str(features, ndigits=None, ensure_ascii=False):
+    """Return the TopoJSON string for the features."""
+    return json.dumps(topology(features, ndigits), sort_keys=True, separators=(',', ':'),
+                      allow_nan=False, ensure_ascii=ensure_ascii)
+
+
+def _feature_lines(geometry_type, coordinates):
+    if geometry_type == 'LineString':
+        return [coordinates]
+    if geometry_type == 'Polygon':
+        return list(coordinates)
+    return [ring for polygon in coordinates for ring in polygon]
+
+
+def _nest(geometry_type, coordinates, line_arcs):
+    if geometry_type == 'LineString':
+        return next(line_arcs)
+    if geometry_type == 'Polygon':
+        return [next(line_arcs) for _ in coordinates]
+    return [[next(line_arcs) for _ in polygon] for polygon in coordinates]
+
+
+def _quantize(line, translate, scale):
+    quantized = np.rint((line - translate) / scale).astype(np.int64)
+    # Rounding to the grid can produce consecutive duplicate points
+    keep = np.r_[True, np.any(quantized[1:] != quantized[:-1], axis=1)]
+    return quantized[keep]
+
+
+def _junctions(lines, closed):
+    """Return for each line a boolean array marking the points where it should be cut.
+
+    A point is a junction if it occurs more than once and its neighbours
+    differ between the occurrences. The end points of open lines are
+    always junctions.
+    """
+    if not lines:
+        return []
+    # The closing point of a ring is the same as its first point
+    points = [line[:-1] if is_closed else line for line, is_closed in zip(lines, closed)]
+    sizes = np.array([len(p) for p in points])
+    offsets = np.r_[0, np.cumsum(sizes)]
+    all_points = np.concatenate(points)
+    width = all_points[:, 1].max() + 1
+    keys = all_points[:, 0] * width + all_points[:, 1]
+    index = np.arange(len(keys))
+    line_start = np.repeat(offsets[:-1], sizes)
+    line_size = np.repeat(sizes, sizes)
+    position = index - line_start
+    previous = line_start + (position - 1) % line_size
+    following = line_start + (position + 1) % line_size
+    low = np.minimum(keys[previous], keys[following])
+    high = np.maximum(keys[previous], keys[following])
+    order = np.lexsort((high, low, keys))
+    sorted_keys = keys[order]
+    new_group = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    differs = np.r_[False, (low[order][1:] != low[order][:-1]) | (high[order][1:] != high[order][:-1])]
+    differs &= ~new_group
+    group = np.cumsum(new_group) - 1
+    group_is_junction = np.maximum.reduceat(differs, np.flatnonzero(new_group))
+    is_junction = np.empty(len(keys), dtype=bool)
+    is_junction[order] = group_is_junction[group]
+    result = []
+    for start, stop, is_closed in zip(offsets[:-1], offsets[1:], closed):
+        junctions = is_junction[start:stop]
+        if not is_closed:
+            junctions[[0, -1]] = True
+        result.append(junctions)
+    return result
+
+
+class _ArcIndex:
+    """Stores unique arcs, an arc and its reverse share the same index."""
+
+    def __init__(self):
+        self.arcs = []
+        self.index = {}
+
+    def add_line(self, line, is_closed, junctions):
+        """Cut the line at its junctions and return the arc indices."""
+        if len(line) < 2:
+            # An arc needs at least two positions
+            return [self.add(np.vstack([line, line]))]
+        cuts = np.flatnonzero(junctions)
+        if is_closed:
+            if len(cuts) == 0:
+                # Start rings without junctions at their lowest point,
+                # so identical rings result in identical arcs.
+                ring = line[:-1]
+                start = np.lexsort((ring[:, 1], ring[:, 0]))[0]
+                ring = np.roll(ring, -start, axis=0)
+                return [self.add(np.vstack([ring, ring[:1]]))]
+            ring = np.roll(line[:-1], -cuts[0], axis=0)
+            line = np.vstack([ring, ring[:1]])
+            cuts = np.r_[cuts - cuts[0], len(ring)]
+        return [self.add(line[start:stop + 1]) for start, stop in zip(cuts[:-1], cuts[1:])]
+
+    def add(self, arc):
+        key = arc.tobytes()
+        if key in self.index:
+            return self.index[key]
+        reverse_key = arc[::-1].tobytes()
+        if reverse_key in self.index:
+            return ~self.index[reverse_key]
+        self.index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return self.index[key]
+
+    def delta_encoded(self):
+        return [np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist() for arc in self.arcs]
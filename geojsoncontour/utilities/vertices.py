@@ -4,36 +4,68 @@ import numpy as np
 import numpy.typing as npt
 from matplotlib.path import Path
 
+_KNOWN_CODES = np.array([Path.STOP, Path.MOVETO, Path.LINETO, Path.CLOSEPOLY], dtype=Path.code_type)
+
+
 def get_vertices_from_path(path: Path) -> Generator[npt.NDArray[float], None, None]:
     """Splits the vertices from path into continous lines,
     by taking into account path.codes
 
     See https://matplotlib.org/stable/api/path_api.html for a
     description of path.vertices/path.codes
+
+    The ring boundaries are found with numpy instead of walking the
+    codes one by one. Open lines are yielded as views of path.vertices,
+    closed rings as views of a single array in which all closing
+    vertices have been inserted at once, so the yielded arrays should
+    be treated as read-only.
     """
-    # path = path.cleaned(curves=False, simplify=False)
     vertices = path.vertices
     codes = path.codes
     if codes is None:
-        codes = [Path.MOVETO] + [Path.LINETO]*(len(vertices)-1)
-    current_vertice = []
-    for (v, c) in zip(vertices, codes):
-        if c == Path.STOP:
-            if len(current_vertice) != 0:
-                yield np.array(current_vertice)
-                current_vertice = []
-        elif c == Path.MOVETO:
-            if len(current_vertice) != 0:
-                yield np.array(current_vertice)
-            current_vertice = [v]
-        elif c == Path.LINETO:
-            current_vertice.append(v)
-        elif c == Path.CLOSEPOLY:
-            if len(current_vertice) != 0:
-                current_vertice.append(current_vertice[0])
-                yield np.array(current_vertice)
-                current_vertice = []
-        else:
-            raise Exception(f"Unknown code {c} encountered")
-    if len(current_vertice) != 0:
-        yield np.array(current_vertice)
+        if len(vertices) != 0:
+            yield vertices
+        return
+    starts, ends, closed = split_codes(codes)
+    if not np.any(closed):
+        for start, end in zip(starts, ends):
+            yield vertices[start:end]
+        return
+    # Insert the first vertex of each closed ring after its last vertex,
+    # the offsets of all following rings shift by the number of
+    # closing vertices inserted before them.
+    closed_ends = ends[closed]
+    vertices = np.insert(vertices, closed_ends, vertices[starts[closed]], axis=0)
+    shift = np.cumsum(closed) - closed
+    starts = starts + shift
+    ends = ends + shift + closed
+    for start, end in zip(starts, ends):
+        yield vertices[start:end]
+
+
+def split_codes(codes):
+    """Return the start and end index of each line in codes, and whether it is closed.
+
+    A line starts at a MOVETO, or at a LINETO that directly follows the
+    start of the path, a CLOSEPOLY or a STOP. It ends before the next
+    start, CLOSEPOLY or STOP. Vertices at CLOSEPOLY and STOP codes are
+    never part of a line.
+    """
+    codes = np.asarray(codes)
+    unknown = ~np.isin(codes, _KNOWN_CODES)
+    if np.any(unknown):
+        raise Exception(f"Unknown code {codes[np.argmax(unknown)]} encountered")
+    is_moveto = codes == Path.MOVETO
+    is_lineto = codes == Path.LINETO
+    is_end = ~(is_moveto | is_lineto)
+    after_end = np.empty_like(is_end)
+    after_end[:1] = True
+    after_end[1:] = is_end[:-1]
+    starts = np.flatnonzero(is_moveto | (is_lineto & after_end))
+    boundaries = np.union1d(starts, np.flatnonzero(is_end))
+    boundaries = np.append(boundaries, len(codes))
+    ends = boundaries[np.searchsorted(boundaries, starts, side='right')]
+    closed = np.zeros(len(starts), dtype=bool)
+    inside = ends < len(codes)
+    closed[inside] = codes[ends[inside]] == Path.CLOSEPOLY
+    return starts, ends, closed
@@ -0,0 +1,165 @@
+"""Write GeoJSON text directly from numpy vertex arrays.
+
+The output is identical to geojson.dumps(..., sort_keys=True, separators=(',', ':'))
+of the equivalent geojson objects, without constructing those objects.
+"""
+import contextlib
+import io
+import itertools
+import json
+import os
+import uuid
+
+import numpy as np
+
+# geojson rounds all coordinates of a geometry to this number of decimals
+GEOJSON_PRECISION = 6
+
+# RFC 8142 GeoJSON text sequences start every feature with this character
+RECORD_SEPARATOR = '\x1e'
+
+
+def write_feature_collection(feature_strings, fileout):
+    """Write a FeatureCollection to fileout, one serialized feature at a time.
+
+    fileout can be a text or binary file object.
+    """
+    write = text_writer(fileout)
+    write('{"features":[')
+    for index, feature_string in enumerate(feature_strings):
+        if index:
+            write(',')
+        write(feature_string)
+    write('],"type":"FeatureCollection"}')
+
+
+def write_feature_sequence(feature_strings, fileout, record_separator=RECORD_SEPARATOR, flush=False):
+    """Write one serialized feature per line, optionally flushing fileout after each feature."""
+    write = text_writer(fileout)
+    for feature_string in feature_strings:
+        write(record_separator + feature_string + '\n')
+        if flush and hasattr(fileout, 'flush'):
+            fileout.flush()
+
+
+@contextlib.contextmanager
+def replace_on_success(filepath):
+    """Open a temporary text file next to filepath, which replaces filepath only if the enclosed block succeeds.
+
+    An error, or an interrupted process, never leaves a partly written
+    file at filepath. The temporary file is removed on error.
+    """
+    filepath = os.fspath(filepath)
+    temporary = '{}.{}.tmp'.format(filepath, uuid.uuid4().hex)
+    try:
+        with open(temporary, 'w') as fileout:
+            yield fileout
+        os.replace(temporary, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        raise
+
+
+def text_writer(fileout):
+    """Return a function that writes strings to a text or binary file object."""
+    if isinstance(fileout, io.TextIOBase):
+        return fileout.write
+    if isinstance(fileout, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(fileout, 'mode', ''):
+        return lambda text: fileout.write(text.encode('utf-8'))
+    return fileout.write
+
+
+def feature_to_str(geometry_type, coordinates, properties, precision=None, ensure_ascii=False):
+    """Return a single Feature as GeoJSON string."""
+    return ''.join([
+        '{"geometry":{"coordinates":',
+        coordinates_to_str(coordinates, precision),
+        ',"type":"', geometry_type, '"},"properties":',
+        json.dumps(properties, sort_keys=True, separators=(',', ':'), allow_nan=False, ensure_ascii=ensure_ascii),
+        ',"type":"Feature"}'
+    ])
+
+
+def quantized_feature_to_str(geometry_type, coordinates, properties, ndigits, ensure_ascii=False):
+    """Return a single Feature as GeoJSON string with coordinates in ndigits fixed decimals.
+
+    All vertices of the feature are rounded at once, by scaling them to
+    integers, and written with one format string. Of every
+    run of consecutive equal vertices of a line or ring only the last is
+    written, and rings (lines) left with fewer than 4 (2) vertices are
+    dropped, polygons with their shell. Returns None if nothing is left.
+    """
+    if geometry_type == 'LineString':
+        polygons, min_vertices = [[coordinates]], 2
+    elif geometry_type == 'Polygon':
+        polygons, min_vertices = [coordinates], 4
+    else:
+        polygons, min_vertices = coordinates, 4
+    rings = [ring for polygon in polygons for ring in polygon]
+    if not rings:
+        return None
+    scale = 10.0 ** ndigits
+    points = rings[0] if len(rings) == 1 else np.concatenate(rings)
+    # Adding zero turns -0.0 into 0.0, which is written without sign
+    vertices = ((np.rint(points * scale) + 0.0) / scale).tolist()
+    vertex = f'[%.{ndigits}f,%.{ndigits}f]'
+    values = []
+    polygon_strings = []
+    stop = 0
+    for polygon in polygons:
+        ring_strings = []
+        for ring in polygon:
+            start, stop = stop, stop + len(ring)
+            if ring_strings is None:
+                continue
+            ring_vertices = vertices[start:stop]
+            # Keep the last of every run of equal vertices, closed rings stay closed
+            ring_vertices = [value for value, following in zip(ring_vertices, ring_vertices[1:])
+                             if value != following] + ring_vertices[-1:]
+            if len(ring_vertices) >= min_vertices:
+                ring_strings.append('[' + (vertex + ',') * (len(ring_vertices) - 1) + vertex + ']')
+                values.extend(ring_vertices)
+            elif not ring_strings:
+                # Without its shell the polygon is dropped
+                ring_strings = None
+        if ring_strings:
+            polygon_strings.append('[' + ','.join(ring_strings) + ']')
+    if not polygon_strings:
+        return None
+    if geometry_type == 'LineString':
+        template = polygon_strings[0][1:-1]
+    elif geometry_type == 'Polygon':
+        template = polygon_strings[0]
+    else:
+        template = '[' + ','.join(polygon_strings) + ']'
+    return ''.join([
+        '{"geometry":{"coordinates":',
+        template % tuple(itertools.chain.from_iterable(values)),
+        ',"type":"', geometry_type, '"},"properties":',
+        json.dumps(properties, sort_keys=True, separators=(',', ':'), allow_nan=False, ensure_ascii=ensure_ascii),
+        ',"type":"Feature"}'
+    ])
+
+
+def coordinates_to_str(coordinates, precision=None):
+    """Return the JSON array for an array of vertices, or nested lists of them."""
+    if isinstance(coordinates, np.ndarray):
+        if precision is not None:
+            coordinates = round_coordinates(coordinates, precision)
+        return json.dumps(coordinates.tolist(), separators=(',', ':'), allow_nan=False)
+    return '[' + ','.join(coordinates_to_str(item, precision) for item in coordinates) + ']'
+
+
+def round_coordinates(coordinates, precision):
+    """Round like the builtin round(), which geojson applies to every coordinate.
+
+    np.around only differs from round() for values that are within
+    floating point error of halfway, those few are rounded with round().
+    """
+    rounded = np.around(coordinates, precision)
+    scaled = coordinates * 10.0 ** precision
+    halfway = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if np.any(halfway):
+        rounded[halfway] = [round(value, precision) for value in coordinates[halfway].tolist()]
+    return rounded
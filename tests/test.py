@@ -1,12 +1,30 @@
+import asyncio
+import gzip
+import io
+import itertools
+import json
 import os
+import shutil
+import tempfile
+import time
 import unittest
 import filecmp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import mock
 
+import geojson
 import numpy
 import matplotlib as mpl
 mpl.use('Agg')  # create plots without running X-server
 import matplotlib.pyplot as plt
 import geojsoncontour
+from matplotlib.path import Path
+from geojsoncontour.utilities.vertices import get_vertices_from_path
+from geojsoncontour.utilities.multipoly import angle, keep_high_angle, orientation, Orientation, ring_metrics
+from geojsoncontour.utilities.simplify import douglas_peucker, visvalingam_whyatt, simplify_polygon, point_in_ring
+from geojsoncontour.utilities.tiles import clip_line, clip_ring, tile_bounds
+from geojsoncontour.utilities.topojson import topology
+from geojsoncontour.utilities.writer import quantized_feature_to_str
 
 
 class TestContourToGeoJson(unittest.TestCase):
@@ -33,6 +51,9 @@ class TestContourToGeoJson(unittest.TestCase):
         if os.path.exists(cls.geojson_file_multipoly):
             os.remove(cls.geojson_file_multipoly)
 
+    def tearDown(self):
+        plt.close('all')
+
     def create_contour(self):
         latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
         figure = plt.figure()
@@ -172,6 +193,399 @@ class TestContourToGeoJson(unittest.TestCase):
         self.assertTrue(filecmp.cmp(self.benchmark_geojson_file_contourf, self.geojson_file_contourf))
         os.remove(self.geojson_file_contourf)
 
+    def test_serialize_fast_matches_benchmark(self):
+        contour = self.create_contour()
+        contourf = self.create_contourf()
+        converters = [
+            (geojsoncontour.contour_to_geojson, contour, self.geojson_file, self.benchmark_geojson_file),
+            (geojsoncontour.contourf_to_geojson, contourf, self.geojson_file_multipoly,
+             self.benchmark_geojson_file_multipoly),
+            (geojsoncontour.contourf_to_geojson_overlap, contourf, self.geojson_file_contourf,
+             self.benchmark_geojson_file_contourf),
+        ]
+        for converter, contour_set, geojson_file, benchmark_file in converters:
+            kwargs = dict(min_angle_deg=self.config.min_angle_between_segments, ndigits=3, unit=self.config.unit)
+            if converter is geojsoncontour.contour_to_geojson:
+                kwargs['stroke_width'] = 5
+            converter(contour_set, geojson_filepath=geojson_file, serialize='fast', **kwargs)
+            self.assertTrue(filecmp.cmp(benchmark_file, geojson_file))
+            os.remove(geojson_file)
+
+    def test_serialize_fast_matches_geojson_dumps(self):
+        contourf = self.create_contourf()
+        for ndigits in [None, 2, 8]:
+            expected = geojsoncontour.contourf_to_geojson(contourf, ndigits=ndigits, unit='°C')
+            result = geojsoncontour.contourf_to_geojson(contourf, ndigits=ndigits, unit='°C', serialize='fast')
+            self.assertEqual(result, expected)
+
+    def test_serialize_quantized(self):
+        contour = self.create_contour()
+        contourf = self.create_contourf()
+        for converter, contour_set in [(geojsoncontour.contour_to_geojson, contour),
+                                       (geojsoncontour.contourf_to_geojson, contourf),
+                                       (geojsoncontour.contourf_to_geojson_overlap, contourf)]:
+            expected = json.loads(converter(contour_set, ndigits=1))['features']
+            result = converter(contour_set, ndigits=1, serialize='quantized')
+            self.assertNotIn('-0.0,', result)
+            features = json.loads(result)['features']
+            self.assertEqual(len(features), len(expected))
+            for feature, expected_feature in zip(features, expected):
+                self.assertEqual(feature['properties'], expected_feature['properties'])
+                coordinates = feature['geometry']['coordinates']
+                lines = [coordinates] if feature['geometry']['type'] == 'LineString' else \
+                    [ring for polygon in ([coordinates] if feature['geometry']['type'] == 'Polygon' else coordinates)
+                     for ring in polygon]
+                for line in lines:
+                    self.assertTrue(all(a != b for a, b in zip(line, line[1:])))
+            self.assertLess(len(result), len(converter(contour_set, ndigits=1, serialize='fast')))
+        self.assertRegex(geojsoncontour.contourf_to_geojson(contourf, ndigits=2, serialize='quantized'),
+                         r'"coordinates":\[\[\[\[-?\d+\.\d\d,-?\d+\.\d\d\]')
+
+    def test_quantized_feature_to_str(self):
+        shell = numpy.array([[0, 0], [1, 0], [1, 1], [1, 1.01], [0, 1], [0, 0]])
+        hole = numpy.array([[0.5, 0.5], [0.51, 0.5], [0.5, 0.51], [0.5, 0.5]])
+        spike = numpy.array([[2, 2], [2.01, 2], [2, 2.01], [2, 2]])
+        result = json.loads(quantized_feature_to_str('MultiPolygon', [[shell, hole], [spike, shell]], {}, 1))
+        self.assertEqual(result['geometry']['coordinates'], [[[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]])
+        self.assertIsNone(quantized_feature_to_str('LineString', numpy.array([[-0.01, 0], [0, 0.01]]), {}, 1))
+
+    def test_serialize_arrays(self):
+        for converter, contour_set in [(geojsoncontour.contour_to_geojson, self.create_contour()),
+                                       (geojsoncontour.contourf_to_geojson, self.create_contourf()),
+                                       (geojsoncontour.contourf_to_geojson_overlap, self.create_contourf())]:
+            expected = converter(contour_set, ndigits=3, serialize=False)
+            collection = converter(contour_set, ndigits=3, serialize='arrays')
+            self.assertIsInstance(collection, geojsoncontour.ContourCollection)
+            self.assertEqual(len(collection), len(expected['features']))
+            self.assertEqual(collection.to_geojson(), expected)
+            self.assertEqual(collection[-1], expected['features'][-1])
+            self.assertEqual(collection.__geo_interface__, json.loads(geojson.dumps(expected)))
+            self.assertEqual(collection.dumps(), converter(contour_set, ndigits=3, serialize='fast'))
+            self.assertEqual(collection.coordinates.shape, (collection.ring_offsets[-1], 2))
+            geometry_type, coordinates, offsets = collection.ragged_array()
+            self.assertEqual(geometry_type, expected['features'][0]['geometry']['type'])
+            self.assertIs(coordinates, collection.coordinates)
+            self.assertEqual(len(offsets[-1]), len(collection) + 1)
+        # Unrounded coordinates are rounded like geojson does
+        collection = geojsoncontour.contourf_to_geojson(self.create_contourf(), ndigits=None, serialize='arrays')
+        self.assertEqual(collection.dumps(), geojson.dumps(collection.to_geojson(), sort_keys=True,
+                                                           separators=(',', ':')))
+
+    def test_write_to_file_object(self):
+        contourf = self.create_contourf()
+        kwargs = dict(min_angle_deg=self.config.min_angle_between_segments, ndigits=3, unit=self.config.unit)
+        with open(self.benchmark_geojson_file_multipoly) as benchmark:
+            expected = benchmark.read()
+        for serialize in [True, 'fast']:
+            buffer = io.StringIO()
+            result = geojsoncontour.contourf_to_geojson(contourf, geojson_filepath=buffer, serialize=serialize,
+                                                        **kwargs)
+            self.assertIsNone(result)
+            self.assertEqual(buffer.getvalue(), expected)
+            binary = io.BytesIO()
+            with gzip.GzipFile(fileobj=binary, mode='wb') as fileout:
+                geojsoncontour.contourf_to_geojson(contourf, geojson_filepath=fileout, serialize=serialize, **kwargs)
+            self.assertEqual(gzip.decompress(binary.getvalue()).decode(), expected)
+
+    def test_geojsonseq_output(self):
+        contourf = self.create_contourf()
+        expected = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, serialize=False)
+        for serialize in [True, 'fast']:
+            result = geojsoncontour.contourf_to_geojson(
+                contourf, ndigits=3, serialize=serialize, output_format='geojsonseq')
+            lines = result.split('\n')
+            self.assertEqual(lines.pop(), '')
+            self.assertEqual(len(lines), len(expected['features']))
+            for line, feature in zip(lines, expected['features']):
+                self.assertTrue(line.startswith('\x1e'))
+                self.assertEqual(geojson.loads(line[1:]), feature)
+
+    def test_ndjson_output_to_file_object(self):
+        contour = self.create_contour()
+        expected = geojsoncontour.contour_to_geojson(contour, ndigits=3, serialize=False)
+        buffer = io.StringIO()
+        geojsoncontour.contour_to_geojson(contour, geojson_filepath=buffer, ndigits=3, output_format='ndjson')
+        lines = buffer.getvalue().splitlines()
+        self.assertEqual([geojson.loads(line) for line in lines], expected['features'])
+        with self.assertRaises(ValueError):
+            geojsoncontour.contour_to_geojson(contour, output_format='unknown')
+
+    def test_topojson_output(self):
+        contourf = self.create_contourf()
+        geojson_result = geojsoncontour.contourf_to_geojson(contourf, ndigits=3)
+        result = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, output_format='topojson')
+        topo = json.loads(result)
+        self.assertEqual(topo['type'], 'Topology')
+        geometries = topo['objects']['contours']['geometries']
+        self.assertEqual(len(geometries), len(json.loads(geojson_result)['features']))
+        self.assertLess(len(result), len(geojson_result) / 2)
+
+    def test_contourf_to_tiles(self):
+        import sqlite3
+        contourf = self.create_contourf()
+        dirname = tempfile.mkdtemp()
+        try:
+            n_tiles = geojsoncontour.contourf_to_tiles(contourf, dirname, zooms=[0, 2], ndigits=3)
+            self.assertEqual(n_tiles, 1 + 16)
+            for x in range(4):
+                for y in range(4):
+                    west, south, east, north = tile_bounds(2, x, y)
+                    with open(os.path.join(dirname, '2', str(x), f'{y}.geojson')) as tile_file:
+                        tile = json.load(tile_file)
+                    coordinates = numpy.array([point for feature in tile['features']
+                                               for polygon in feature['geometry']['coordinates']
+                                               for ring in polygon for point in ring])
+                    self.assertTrue(numpy.all(coordinates >= [west - 1e-3, south - 1e-3]))
+                    self.assertTrue(numpy.all(coordinates <= [east + 1e-3, north + 1e-3]))
+            mbtiles = os.path.join(dirname, 'contours.mbtiles')
+            geojsoncontour.contourf_to_tiles(contourf, mbtiles, zooms=[0, 2], ndigits=3)
+            with sqlite3.connect(mbtiles) as connection:
+                # MBTiles numbers the rows from the south
+                tile_data, = connection.execute(
+                    'SELECT tile_data FROM tiles WHERE zoom_level=2 AND tile_column=1 AND tile_row=3').fetchone()
+                metadata = dict(connection.execute('SELECT name, value FROM metadata'))
+            connection.close()
+            with open(os.path.join(dirname, '2', '1', '0.geojson'), 'rb') as tile_file:
+                self.assertEqual(tile_data, tile_file.read())
+            self.assertEqual(metadata['maxzoom'], '2')
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_contour_to_tiles(self):
+        contour = self.create_contour()
+        dirname = tempfile.mkdtemp()
+        try:
+            geojsoncontour.contour_to_tiles(contour, dirname, zooms=[1], ndigits=3)
+            with open(os.path.join(dirname, '1', '0', '0.geojson')) as tile_file:
+                geometry_types = {feature['geometry']['type'] for feature in json.load(tile_file)['features']}
+            self.assertEqual(geometry_types, {'LineString'})
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_workers(self):
+        contour = self.create_contour()
+        contourf = self.create_contourf()
+        expected_contour = geojsoncontour.contour_to_geojson(contour, ndigits=3, min_angle_deg=10)
+        expected_contourf = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10)
+        # Small batches, so that levels are split over several tasks
+        with mock.patch('geojsoncontour.contour.BATCH_VERTICES', 100):
+            self.assertEqual(geojsoncontour.contour_to_geojson(contour, ndigits=3, min_angle_deg=10, workers=3),
+                             expected_contour)
+            self.assertEqual(geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10, workers=3),
+                             expected_contourf)
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                result = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10, workers=executor)
+            self.assertEqual(result, expected_contourf)
+            contourf._contour_generator = None
+            self.assertEqual(geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10, workers=3),
+                             geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10))
+
+    def test_tricontourf(self):
+        latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
+        X, Y = numpy.meshgrid(lonrange, latrange)
+        figure = plt.figure()
+        ax = figure.add_subplot(111)
+        tricontourf = ax.tricontourf(X.ravel(), Y.ravel(), Z.ravel(), levels=self.config.levels)
+        expected = geojsoncontour.contourf_to_geojson(tricontourf, ndigits=3)
+        self.assertEqual(geojsoncontour.contourf_to_geojson(tricontourf, ndigits=3, workers=2), expected)
+        plt.close(figure)
+        result = json.loads(expected)
+        self.assertEqual(len(result['features']), len(self.config.levels) - 1)
+        for feature in result['features']:
+            self.assertEqual(feature['geometry']['type'], 'MultiPolygon')
+
+    def test_batch_to_geojson(self):
+        latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
+        contourfs = [plt.contourf(lonrange, latrange, Z * scale, levels=self.config.levels) for scale in (1, 2)]
+        expected = [geojsoncontour.contourf_to_geojson(contourf, ndigits=3, unit='m') for contourf in contourfs]
+        self.assertEqual(geojsoncontour.batch_to_geojson(geojsoncontour.contourf_to_geojson, contourfs,
+                                                         ndigits=3, unit='m'), expected)
+        self.assertEqual(geojsoncontour.batch_to_geojson(geojsoncontour.contourf_to_geojson, contourfs, workers=2,
+                                                         ndigits=3, unit='m'), expected)
+        grids = [(lonrange, latrange, Z * scale, self.config.levels) for scale in (1, 2)]
+        dirname = tempfile.mkdtemp()
+        try:
+            filepaths = [os.path.join(dirname, f'{index}.geojson') for index in range(2)]
+            geojsoncontour.batch_to_geojson(geojsoncontour.array_to_geojson, grids, filepaths, ndigits=3)
+            for grid, filepath in zip(grids, filepaths):
+                with open(filepath) as geojson_file:
+                    self.assertEqual(geojson_file.read(), geojsoncontour.array_to_geojson(*grid, ndigits=3))
+            with self.assertRaises(ValueError):
+                geojsoncontour.batch_to_geojson(geojsoncontour.array_to_geojson, grids, filepaths[:1])
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_failed_conversion_keeps_file(self):
+        contourf = self.create_contourf()
+        dirname = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(dirname, 'out.geojson')
+            geojsoncontour.contourf_to_geojson(contourf, geojson_filepath=filepath, ndigits=3)
+            with open(filepath) as geojson_file:
+                expected = geojson_file.read()
+            for output_format in ['geojson', 'geojsonseq']:
+                with self.assertRaises(ValueError):
+                    geojsoncontour.contourf_to_geojson(contourf, geojson_filepath=filepath, simplify='bogus',
+                                                       output_format=output_format)
+                with open(filepath) as geojson_file:
+                    self.assertEqual(geojson_file.read(), expected)
+            self.assertEqual(os.listdir(dirname), ['out.geojson'])
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_stats(self):
+        contourf = self.create_contourf()
+        stats = geojsoncontour.ConversionStats()
+        result = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10, stats=stats)
+        features = json.loads(result)['features']
+        self.assertEqual(stats.counts['features'], len(features))
+        self.assertEqual(stats.counts['rings'], sum(len(polygon) for feature in features
+                                                    for polygon in feature['geometry']['coordinates']))
+        self.assertEqual(stats.counts['output_bytes'], len(result))
+        for stage in ('total', 'features', 'keep_high_angle', 'orientation', 'geojson', 'serialize'):
+            self.assertGreater(stats.seconds[stage], 0)
+        self.assertLess(stats.seconds['keep_high_angle'], stats.seconds['features'])
+        callback_stats = []
+        geojsoncontour.contour_to_geojson(self.create_contour(), geojson_filepath=self.geojson_file,
+                                          stats=callback_stats.append)
+        self.assertEqual(callback_stats[0].counts['output_bytes'], os.path.getsize(self.geojson_file))
+        os.remove(self.geojson_file)
+
+    def test_stats_concurrent(self):
+        latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
+        contourfs = [plt.contourf(lonrange, latrange, Z * scale, levels=self.config.levels) for scale in (1, 2, 3, 4)]
+        serial = geojsoncontour.ConversionStats()
+        geojsoncontour.batch_to_geojson(geojsoncontour.contourf_to_geojson, contourfs * 3, ndigits=3,
+                                        min_angle_deg=10, stats=serial)
+        stats = geojsoncontour.ConversionStats()
+        geojsoncontour.batch_to_geojson(geojsoncontour.contourf_to_geojson, contourfs * 3, workers=6, ndigits=3,
+                                        min_angle_deg=10, stats=stats)
+        self.assertEqual(stats.counts, serial.counts)
+        for stage, seconds in stats.seconds.items():
+            self.assertGreaterEqual(seconds, 0, stage)
+        self.assertLessEqual(stats.seconds['features'] + stats.seconds['geojson'] + stats.seconds['serialize'],
+                             stats.seconds['total'] * (1 + 1e-9))
+        self.assertLessEqual(stats.seconds['keep_high_angle'] + stats.seconds['orientation'],
+                             stats.seconds['features'])
+
+    def test_contourf_holes_inside_shells(self):
+        # Noise smoothed with a box filter has many small rings, of which
+        # min_angle_deg flips the orientation of some
+        Z = numpy.random.default_rng(3).random((60, 60))
+        for _ in range(3):
+            padded = numpy.pad(Z, 1, mode='edge')
+            Z = sum(padded[i:i + 60, j:j + 60] for i in range(3) for j in range(3)) / 9
+        contourf = plt.contourf(Z, levels=8)
+        for workers in [None, 2]:
+            result = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10, workers=workers,
+                                                        serialize=False)
+            n_holes = 0
+            for feature in result['features']:
+                for shell, *holes in feature['geometry']['coordinates']:
+                    for hole in holes:
+                        n_holes += 1
+                        self.assertTrue(point_in_ring(hole[0], numpy.array(shell)))
+            self.assertGreater(n_holes, 0)
+
+    def test_contourf_without_contour_generator(self):
+        # Unpickled contour sets have no contour generator
+        contourf = self.create_contourf()
+        expected = geojsoncontour.contourf_to_geojson(contourf, ndigits=3)
+        contourf._contour_generator = None
+        self.assertEqual(geojsoncontour.contourf_to_geojson(contourf, ndigits=3), expected)
+
+    def test_array_to_geojson(self):
+        latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
+        for extend in ['neither', 'both']:
+            contourf = plt.contourf(lonrange, latrange, Z, levels=self.config.levels, cmap=self.config.colormap,
+                                    extend=extend)
+            expected = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_angle_deg=10)
+            result = geojsoncontour.array_to_geojson(lonrange, latrange, Z, self.config.levels, ndigits=3,
+                                                     min_angle_deg=10, cmap=self.config.colormap, extend=extend)
+            self.assertEqual(result, expected)
+        contour = self.create_contour()
+        expected = geojsoncontour.contour_to_geojson(contour, ndigits=3)
+        result = geojsoncontour.array_to_geojson(lonrange, latrange, Z, self.config.levels, filled=False, ndigits=3,
+                                                 cmap=self.config.colormap)
+        self.assertEqual(result, expected)
+        # Other algorithms have the same properties, but may order the vertices differently
+        contourf = plt.contourf(lonrange, latrange, Z, levels=self.config.levels, cmap=self.config.colormap)
+        for filled, expected in [(True, contourf), (False, contour)]:
+            expected = (geojsoncontour.contourf_to_geojson if filled else geojsoncontour.contour_to_geojson)(
+                expected, ndigits=3, serialize=False)
+            result = geojsoncontour.array_to_geojson(lonrange, latrange, Z, self.config.levels, filled=filled,
+                                                     ndigits=3, cmap=self.config.colormap, serialize=False,
+                                                     algorithm='serial')
+            self.assertEqual([f['properties'] for f in result['features']],
+                             [f['properties'] for f in expected['features']])
+
+    def test_array_to_geojson_holes(self):
+        # Rings around a peak (shell) and a pit (hole) in the same band
+        x = numpy.linspace(-3, 3, 61)
+        X, Y = numpy.meshgrid(x, x)
+        Z = numpy.exp(-(X - 1) ** 2 - Y ** 2) - numpy.exp(-(X + 1) ** 2 - Y ** 2)
+        result = geojsoncontour.array_to_geojson(x, x, Z, [-0.5, 0.5], ndigits=3, serialize=False)
+        polygons = result['features'][0]['geometry']['coordinates']
+        self.assertEqual(len(polygons), 1)
+        shell, *holes = polygons[0]
+        self.assertEqual(len(holes), 2)
+        self.assertEqual(orientation(numpy.array(shell)), Orientation.CCW)
+        for hole in holes:
+            self.assertEqual(orientation(numpy.array(hole)), Orientation.CW)
+
+    def test_min_area(self):
+        latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
+        contourf = self.create_contourf()
+        expected = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, serialize='arrays')
+        areas = numpy.abs(ring_metrics(expected.coordinates, expected.ring_offsets).area)
+        min_area = numpy.median(areas)
+        for result in [geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_area=min_area, serialize='arrays'),
+                       geojsoncontour.array_to_geojson(lonrange, latrange, Z, self.config.levels, ndigits=3,
+                                                       cmap=self.config.colormap, min_area=min_area,
+                                                       serialize='arrays')]:
+            result_areas = numpy.abs(ring_metrics(result.coordinates, result.ring_offsets).area)
+            self.assertGreater(len(result_areas), 0)
+            self.assertLess(len(result_areas), len(areas))
+            self.assertTrue(numpy.all(result_areas >= min_area))
+        contourf._contour_generator = None
+        result = geojsoncontour.contourf_to_geojson(contourf, ndigits=3, min_area=min_area, serialize='arrays')
+        self.assertTrue(numpy.all(numpy.abs(ring_metrics(result.coordinates, result.ring_offsets).area) >= min_area))
+        overlap = geojsoncontour.contourf_to_geojson_overlap(contourf, ndigits=3, min_area=min_area, serialize='arrays')
+        self.assertTrue(numpy.all(numpy.abs(ring_metrics(overlap.coordinates, overlap.ring_offsets).area) >= min_area))
+
+    def test_iter_features(self):
+        contour = self.create_contour()
+        contourf = self.create_contourf()
+        pairs = [
+            (geojsoncontour.contour_to_geojson, geojsoncontour.iter_contour_features, contour),
+            (geojsoncontour.contourf_to_geojson, geojsoncontour.iter_contourf_features, contourf),
+            (geojsoncontour.contourf_to_geojson_overlap, geojsoncontour.iter_contourf_overlap_features, contourf),
+        ]
+        for converter, iter_features, contour_set in pairs:
+            features = iter_features(contour_set, ndigits=3)
+            self.assertFalse(isinstance(features, list))
+            expected = converter(contour_set, ndigits=3, serialize=False)
+            self.assertEqual(list(features), expected['features'])
+
+    def test_contourf_to_geojson_simplify(self):
+        contourf = self.create_contourf()
+        result = geojsoncontour.contourf_to_geojson(contourf=contourf, ndigits=3, serialize=False)
+        for simplify, tolerance in [('douglas-peucker', 0.5), ('visvalingam', 0.5)]:
+            simplified = geojsoncontour.contourf_to_geojson(
+                contourf=contourf,
+                ndigits=3,
+                simplify=simplify,
+                simplify_tolerance=tolerance,
+                serialize=False
+            )
+            self.assertEqual(len(simplified['features']), len(result['features']))
+            self.assertLess(len(geojson.dumps(simplified)), len(geojson.dumps(result)) / 2)
+
+    def test_simplify_unknown_method(self):
+        contour = self.create_contour()
+        with self.assertRaises(ValueError):
+            geojsoncontour.contour_to_geojson(contour=contour, simplify='unknown')
+
     @staticmethod
     def create_grid_data():
         grid_size = 1.0
@@ -195,6 +609,562 @@ class TestContourToGeoJson(unittest.TestCase):
         contourf = plt.contourf(x, y, z)
         mp = geojsoncontour.contourf_to_geojson(contourf, ndigits=3)
 
+class TestVerticesFromPath(unittest.TestCase):
+
+    def test_multiple_rings(self):
+        vertices = numpy.array([[0, 0], [1, 0], [1, 1], [0, 0],
+                                [2, 2], [3, 2], [3, 3], [0, 0],
+                                [5, 5], [6, 6]], dtype=float)
+        codes = [Path.MOVETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY,
+                 Path.MOVETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY,
+                 Path.MOVETO, Path.LINETO]
+        rings = list(get_vertices_from_path(Path(vertices, codes)))
+        self.assertEqual(len(rings), 3)
+        numpy.testing.assert_array_equal(rings[0], [[0, 0], [1, 0], [1, 1], [0, 0]])
+        numpy.testing.assert_array_equal(rings[1], [[2, 2], [3, 2], [3, 3], [2, 2]])
+        numpy.testing.assert_array_equal(rings[2], [[5, 5], [6, 6]])
+
+    def test_consecutive_moveto_and_stop(self):
+        vertices = numpy.array([[0, 0], [1, 1], [2, 2], [3, 3], [9, 9]], dtype=float)
+        codes = [Path.MOVETO, Path.MOVETO, Path.LINETO, Path.LINETO, Path.STOP]
+        rings = list(get_vertices_from_path(Path(vertices, codes)))
+        self.assertEqual(len(rings), 2)
+        numpy.testing.assert_array_equal(rings[0], [[0, 0]])
+        numpy.testing.assert_array_equal(rings[1], [[1, 1], [2, 2], [3, 3]])
+
+    def test_no_codes(self):
+        vertices = numpy.array([[0, 0], [1, 0], [1, 1]], dtype=float)
+        rings = list(get_vertices_from_path(Path(vertices)))
+        self.assertEqual(len(rings), 1)
+        numpy.testing.assert_array_equal(rings[0], vertices)
+        self.assertEqual(list(get_vertices_from_path(Path(numpy.zeros((0, 2))))), [])
+
+    def test_unknown_code(self):
+        vertices = numpy.array([[0, 0], [1, 0], [1, 1]], dtype=float)
+        path = Path(vertices, [Path.MOVETO, Path.CURVE3, Path.CURVE3])
+        with self.assertRaises(Exception):
+            list(get_vertices_from_path(path))
+
+
+class TestKeepHighAngle(unittest.TestCase):
+
+    @staticmethod
+    def keep_high_angle_sequential(v, min_angle_deg):
+        accepted = [v[0]]
+        v1 = v[1] - v[0]
+        for i in range(1, len(v) - 2):
+            v2 = v[i + 1] - v[i - 1]
+            if numpy.fabs(angle(v1, v2) * 180.0 / numpy.pi) > min_angle_deg:
+                accepted.append(v[i])
+                v1 = v[i] - v[i - 1]
+        accepted.append(v[-1])
+        return numpy.array(accepted)
+
+    def test_matches_sequential_filter(self):
+        rng = numpy.random.default_rng(0)
+        for min_angle_deg in [1, 5, 15, 60]:
+            vertices = numpy.cumsum(rng.normal(size=(500, 2)), axis=0)
+            expected = self.keep_high_angle_sequential(vertices, min_angle_deg)
+            numpy.testing.assert_array_equal(keep_high_angle(vertices, min_angle_deg), expected)
+
+    def test_straight_line(self):
+        vertices = numpy.array([[0, 0], [1, 1], [2, 2], [3, 3], [4, 4]], dtype=float)
+        numpy.testing.assert_array_equal(keep_high_angle(vertices, 5), [[0, 0], [4, 4]])
+
+    def test_duplicate_vertices(self):
+        vertices = numpy.array([[0, 0], [1, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=float)
+        result = keep_high_angle(vertices, 5)
+        numpy.testing.assert_array_equal(result, [[0, 0], [1, 0], [0, 0]])
+
+
+class TestRingMetrics(unittest.TestCase):
+
+    def test_metrics(self):
+        square = [[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]
+        triangle = [[10, 10], [10, 11], [11, 10]]
+        points = numpy.array(square + triangle, dtype=float) + 1e6
+        metrics = ring_metrics(points, [0, 5, 5, 8])
+        numpy.testing.assert_allclose(metrics.area, [4, 0, -0.5])
+        self.assertEqual(metrics.orientation.tolist(), [Orientation.CCW, Orientation.CW, Orientation.CW])
+        numpy.testing.assert_array_equal(metrics.bbox[[0, 2]] - 1e6, [[0, 0, 2, 2], [10, 10, 11, 11]])
+        self.assertTrue(numpy.all(numpy.isnan(metrics.bbox[1])))
+        self.assertEqual(metrics.n_vertices.tolist(), [5, 0, 3])
+
+    def test_matches_orientation(self):
+        rng = numpy.random.default_rng(0)
+        rings = []
+        for _ in range(50):
+            angles = numpy.sort(rng.uniform(0, 2 * numpy.pi, rng.integers(3, 20)))
+            ring = numpy.column_stack([numpy.cos(angles), numpy.sin(angles)]) * rng.uniform(0.1, 10)
+            ring = ring[::rng.choice([-1, 1])]
+            rings.append(numpy.vstack([ring, ring[:1]]))
+        offsets = numpy.cumsum([0] + [len(ring) for ring in rings])
+        metrics = ring_metrics(numpy.concatenate(rings), offsets)
+        self.assertEqual(metrics.orientation.tolist(), [orientation(ring) for ring in rings])
+
+
+class TestSimplify(unittest.TestCase):
+
+    def test_douglas_peucker(self):
+        vertices = numpy.array([[0, 0], [1, 0.1], [2, -0.1], [3, 5], [4, 6], [5, 7.01], [6, 8]], dtype=float)
+        numpy.testing.assert_array_equal(douglas_peucker(vertices, 0.5), [[0, 0], [2, -0.1], [3, 5], [6, 8]])
+        numpy.testing.assert_array_equal(douglas_peucker(vertices, 0.0), vertices)
+
+    def test_visvalingam_whyatt(self):
+        vertices = numpy.array([[0, 0], [1, 0], [2, 0], [3, 0], [3, 3], [4, 3]], dtype=float)
+        numpy.testing.assert_array_equal(visvalingam_whyatt(vertices, 0.1), [[0, 0], [3, 0], [3, 3], [4, 3]])
+
+    def test_hole_does_not_cross_shell(self):
+        # Removing the bump at (-2, 10) would move the shell through the hole
+        shell = numpy.array([(0, 0), (20, 0), (20, 20), (0, 20), (-2, 10), (0, 0)], dtype=float)
+        hole = numpy.array([(-1, 10), (10, 8), (10, 12), (-1, 10)], dtype=float)
+        rings = simplify_polygon([shell, hole], 'douglas-peucker', 3)
+        self.assertEqual(len(rings), 2)
+        numpy.testing.assert_array_equal(rings[0], shell)
+        numpy.testing.assert_array_equal(rings[1], hole)
+
+    def test_collapsed_shell(self):
+        shell = numpy.array([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)], dtype=float)
+        self.assertIsNone(simplify_polygon([shell], 'douglas-peucker', 2))
+
+
+class TestTopoJSON(unittest.TestCase):
+
+    def test_shared_arc_is_stored_once(self):
+        left = numpy.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=float)
+        right = numpy.array([[1, 0], [2, 0], [2, 1], [1, 1], [1, 0]], dtype=float)
+        topo = topology([('Polygon', [left], {}), ('Polygon', [right], {})], ndigits=1)
+        left_arcs, right_arcs = [g['arcs'][0] for g in topo['objects']['contours']['geometries']]
+        self.assertEqual(len(topo['arcs']), 3)
+        self.assertIn(~left_arcs[0], right_arcs)
+        # Delta encoded, quantized to the ndigits grid
+        self.assertEqual(topo['arcs'][left_arcs[0]], [[10, 0], [0, 10]])
+        self.assertEqual(topo['transform'], {'scale': [0.1, 0.1], 'translate': [0.0, 0.0]})
+
+    def test_identical_rings_without_junctions(self):
+        ring = numpy.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=float)
+        hole = numpy.roll(ring[:-1], 2, axis=0)[::-1]
+        hole = numpy.vstack([hole, hole[:1]])
+        outer = numpy.array([[-1, -1], [2, -1], [2, 2], [-1, 2], [-1, -1]], dtype=float)
+        topo = topology([('MultiPolygon', [[ring]], {}), ('MultiPolygon', [[outer, hole]], {})], ndigits=1)
+        inner_arcs = topo['objects']['contours']['geometries'][0]['arcs'][0][0]
+        hole_arcs = topo['objects']['contours']['geometries'][1]['arcs'][0][1]
+        self.assertEqual(len(topo['arcs']), 2)
+        self.assertEqual(hole_arcs, [~inner_arcs[0]])
+
+
+class TestTiles(unittest.TestCase):
+
+    def test_clip_ring(self):
+        square = numpy.array([[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]], dtype=float)
+        clipped = clip_ring(square, (1, 1, 2, 5))
+        self.assertEqual(clipped.tolist(), [[2, 1], [2, 4], [1, 4], [1, 1], [2, 1]])
+        self.assertIsNone(clip_ring(square, (5, 5, 6, 6)))
+
+    def test_clip_line(self):
+        line = numpy.array([[0, 0], [3, 0], [3, 3], [0, 3], [0, 6], [3, 6]], dtype=float)
+        pieces = clip_line(line, (1, -1, 4, 7))
+        self.assertEqual([piece.tolist() for piece in pieces],
+                         [[[1, 0], [3, 0], [3, 3], [1, 3]], [[1, 6], [3, 6]]])
+
+    def test_tile_bounds(self):
+        west, south, east, north = tile_bounds(1, 1, 0)
+        self.assertEqual((west, south, east), (0.0, 0.0, 180.0))
+        self.assertAlmostEqual(north, 85.0511287798)
+
+
+class TestIncrementalContours(unittest.TestCase):
+
+    def setUp(self):
+        self.x = numpy.linspace(0, 10, 61)
+        self.y = numpy.linspace(0, 5, 31)
+        X, Y = numpy.meshgrid(self.x, self.y)
+        self.z = numpy.sin(X) * numpy.cos(Y)
+        self.levels = numpy.linspace(-1, 1, 9)
+
+    def test_same_as_chunked_array_to_geojson(self):
+        masked = numpy.ma.masked_greater(self.z, 0.6)
+        for z, filled, algorithm in itertools.product((self.z, masked), (True, False), (None, 'serial')):
+            contours = geojsoncontour.IncrementalContours(self.x, self.y, z, self.levels, chunk_size=8,
+                                                          filled=filled, ndigits=3, algorithm=algorithm)
+            expected = geojsoncontour.array_to_geojson(self.x, self.y, z, self.levels, filled=filled,
+                                                       ndigits=3, chunk_size=8, algorithm=algorithm)
+            self.assertEqual(contours.to_geojson(), expected)
+
+    def test_update(self):
+        for filled in (True, False):
+            contours = geojsoncontour.IncrementalContours(self.x, self.y, self.z, self.levels, chunk_size=8,
+                                                          filled=filled, ndigits=3)
+            z = self.z.copy()
+            z[14:17, 20:23] += 0.5
+            expected = geojsoncontour.IncrementalContours(self.x, self.y, z, self.levels, chunk_size=8,
+                                                          filled=filled, ndigits=3).to_geojson()
+            # The changed points lie on a chunk boundary
+            self.assertEqual(contours.update(z), 2)
+            self.assertEqual(contours.to_geojson(), expected)
+            self.assertEqual(contours.update(z), 0)
+            bbox = (self.x[20], self.y[14], self.x[22], self.y[16])
+            self.assertEqual(contours.update(z, bbox), 2)
+            self.assertEqual(contours.to_geojson(), expected)
+
+    def test_update_of_minimum_recontours_all_chunks(self):
+        contours = geojsoncontour.IncrementalContours(self.x, self.y, self.z, self.levels, chunk_size=8)
+        z = self.z.copy()
+        z[0, 0] = -1
+        self.assertEqual(contours.update(z), len(contours.chunks()))
+
+    def test_update_shape_mismatch(self):
+        contours = geojsoncontour.IncrementalContours(self.x, self.y, self.z, self.levels, chunk_size=8)
+        with self.assertRaises(ValueError):
+            contours.update(self.z[1:])
+
+
+class TestConversionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        latrange, lonrange, Z = TestContourToGeoJson.create_grid_data()
+        self.contourf = plt.contourf(lonrange, latrange, Z, levels=numpy.linspace(0, 200, 8))
+
+    def tearDown(self):
+        plt.close('all')
+        shutil.rmtree(self.dirname)
+
+    def test_memory_cache(self):
+        cache = geojsoncontour.ConversionCache(maxsize=1)
+        result = cache.contourf_to_geojson(self.contourf, ndigits=3)
+        self.assertEqual(result, geojsoncontour.contourf_to_geojson(self.contourf, ndigits=3).encode('utf-8'))
+        # A hit returns the same object, also when a default is passed explicitly
+        self.assertIs(cache.contourf_to_geojson(self.contourf, ndigits=3, unit=''), result)
+        other = cache.contourf_to_geojson(self.contourf, ndigits=2)
+        self.assertNotEqual(other, result)
+        self.assertEqual(cache.cache_info(), (1, 2, 1, 1))
+        cache.contourf_to_geojson(self.contourf, ndigits=3)
+        self.assertEqual(cache.cache_info().misses, 3)
+
+    def test_array_key(self):
+        cache = geojsoncontour.ConversionCache()
+        x, y = numpy.arange(4.0), numpy.arange(3.0)
+        z = numpy.arange(12.0).reshape(3, 4)
+        result = cache.array_to_geojson(x, y, z, [0, 5, 11])
+        self.assertIs(cache.array_to_geojson(x, y, z.copy(), [0, 5, 11]), result)
+        z[0, 0] = 1
+        self.assertIsNot(cache.array_to_geojson(x, y, z, [0, 5, 11]), result)
+        masked = numpy.ma.masked_less(z, 4)
+        self.assertEqual(cache.array_to_geojson(x, y, masked, [0, 5, 11]),
+                         geojsoncontour.array_to_geojson(x, y, masked, [0, 5, 11], strdump=True).encode('utf-8'))
+
+    def test_options_key(self):
+        cache = geojsoncontour.ConversionCache()
+        x, y = numpy.arange(4.0), numpy.arange(3.0)
+        z = numpy.arange(12.0).reshape(3, 4)
+        result = cache.array_to_geojson(x, y, z, [0, 5, 11], cmap=plt.get_cmap('jet'))
+        stats = geojsoncontour.ConversionStats()
+        self.assertIs(cache.array_to_geojson(x, y, z, [0, 5, 11], cmap=plt.get_cmap('jet').copy(), stats=stats),
+                      result)
+        self.assertEqual(stats.counts, {})
+        self.assertIs(cache.contourf_to_geojson(self.contourf, ndigits=3, workers=2),
+                      cache.contourf_to_geojson(self.contourf, ndigits=3))
+        self.assertIsNot(cache.array_to_geojson(x, y, z, [0, 5, 11], cmap=plt.get_cmap('jet').reversed()), result)
+
+    def test_disk_cache(self):
+        path = os.path.join(self.dirname, 'cache.sqlite')
+        cache = geojsoncontour.ConversionCache(path=path)
+        result = cache.contourf_to_geojson(self.contourf, ndigits=3)
+        cache.close()
+        cache = geojsoncontour.ConversionCache(path=path)
+        self.assertEqual(cache.contourf_to_geojson(self.contourf, ndigits=3), result)
+        self.assertEqual(cache.cache_info().hits, 1)
+        cache.close()
+
+    def test_disk_size_cap(self):
+        path = os.path.join(self.dirname, 'cache.sqlite')
+        first = geojsoncontour.ConversionCache(maxsize=0, path=path).contourf_to_geojson(self.contourf, ndigits=3)
+        cache = geojsoncontour.ConversionCache(maxsize=0, path=path, max_disk_bytes=int(1.5 * len(first)))
+        cache.contourf_to_geojson(self.contourf, ndigits=2)
+        cache.contourf_to_geojson(self.contourf, ndigits=3)
+        self.assertEqual(cache.cache_info().misses, 2)
+        cache.close()
+
+    def test_serialize_false(self):
+        cache = geojsoncontour.ConversionCache()
+        with self.assertRaises(ValueError):
+            cache.contourf_to_geojson(self.contourf, serialize=False)
+        with self.assertRaises(TypeError):
+            cache.contourf_to_geojson(self.contourf, geojson_filepath='contourf.geojson')
+
+
+class TestAsyncConverter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        x = numpy.linspace(-10, 10, 120)
+        y = numpy.linspace(-5, 5, 80)
+        X, Y = numpy.meshgrid(x, y)
+        self.grid = (x, y, numpy.sin(X) * numpy.cos(2 * Y), numpy.linspace(-1, 1, 9))
+
+    async def test_convert(self):
+        converter = geojsoncontour.AsyncConverter(max_concurrent=2)
+        results = await asyncio.gather(*[converter.array_to_geojson(*self.grid, ndigits=ndigits)
+                                         for ndigits in [2, 3, 4]])
+        for ndigits, result in zip([2, 3, 4], results):
+            self.assertEqual(result, geojsoncontour.array_to_geojson(*self.grid, ndigits=ndigits))
+
+    async def test_max_concurrent(self):
+        running = []
+        maximum = []
+
+        def convert(*args, **kwargs):
+            running.append(None)
+            maximum.append(len(running))
+            time.sleep(0.01)
+            running.pop()
+
+        converter = geojsoncontour.AsyncConverter(ThreadPoolExecutor(4), max_concurrent=2)
+        with mock.patch('geojsoncontour.contour.array_to_geojson', convert):
+            await asyncio.gather(*[converter.array_to_geojson(*self.grid) for _ in range(6)])
+        self.assertEqual(max(maximum), 2)
+
+    async def test_stream(self):
+        converter = geojsoncontour.AsyncConverter()
+        for output_format in ['geojson', 'geojsonseq', 'topojson']:
+            chunks = [chunk async for chunk in converter.stream(geojsoncontour.array_to_geojson, *self.grid,
+                                                                ndigits=3, output_format=output_format,
+                                                                buffer_chars=1000)]
+            self.assertGreater(len(chunks), 1 if output_format != 'topojson' else 0)
+            self.assertEqual(''.join(chunks), geojsoncontour.array_to_geojson(*self.grid, ndigits=3,
+                                                                              output_format=output_format))
+        # chunk_size is passed to the converter
+        chunks = [chunk async for chunk in converter.stream(geojsoncontour.array_to_geojson, *self.grid,
+                                                            ndigits=3, chunk_size=20)]
+        self.assertEqual(''.join(chunks), geojsoncontour.array_to_geojson(*self.grid, ndigits=3, chunk_size=20))
+        self.assertNotEqual(''.join(chunks), geojsoncontour.array_to_geojson(*self.grid, ndigits=3))
+        for kwargs in [{'output_format': 'xml'}, {'serialize': False}, {'serialize': 'arrays'}]:
+            with self.assertRaises(ValueError):
+                async for _ in converter.stream(geojsoncontour.array_to_geojson, *self.grid, **kwargs):
+                    pass
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            with self.assertRaises(TypeError):
+                async for _ in geojsoncontour.AsyncConverter(executor).stream(geojsoncontour.array_to_geojson,
+                                                                               *self.grid):
+                    pass
+
+    async def test_stream_cancel(self):
+        converter = geojsoncontour.AsyncConverter(max_concurrent=1)
+        stats = geojsoncontour.ConversionStats()
+        chunks = converter.stream(geojsoncontour.array_to_geojson, *self.grid, buffer_chars=10, max_pending=1,
+                                  stats=stats)
+        await chunks.__anext__()
+        await chunks.aclose()
+        n_features = len(json.loads(geojsoncontour.array_to_geojson(*self.grid))['features'])
+        self.assertLess(stats.counts['features'], n_features)
+        # The concurrency slot is free again
+        self.assertTrue(await asyncio.wait_for(converter.array_to_geojson(*self.grid), 10))
+
+
+def netcdf_backend_available():
+    try:
+        import netCDF4  # noqa: F401
+        return True
+    except ImportError:
+        pass
+    try:
+        import scipy  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@unittest.skipUnless(netcdf_backend_available(), 'requires netCDF4 or scipy')
+class TestNetCDFToGeoJson(unittest.TestCase):
+
+    def setUp(self):
+        import xarray
+        self.dirname = tempfile.mkdtemp()
+        self.ncfile = os.path.join(self.dirname, 'test.nc')
+        lat = numpy.linspace(-10, 10, 40)
+        lon = numpy.linspace(0, 30, 60)
+        data = numpy.random.default_rng(0).random((4, 40, 60)).cumsum(axis=2)
+        dataset = xarray.Dataset(
+            {'tas': (('time', 'lat', 'lon'), data, {'units': 'K'})},
+            coords={'time': numpy.arange(4), 'lat': lat, 'lon': lon}
+        )
+        dataset.to_netcdf(self.ncfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def geojson_files(self):
+        return sorted(f for f in os.listdir(self.dirname) if f.endswith('.geojson'))
+
+    def pop_geojson_files(self):
+        contents = {}
+        for filename in self.geojson_files():
+            with open(os.path.join(self.dirname, filename)) as geojson_file:
+                contents[filename] = geojson_file.read()
+            os.remove(os.path.join(self.dirname, filename))
+        return contents
+
+    def test_parallel_output_identical_to_serial(self):
+        from geojsoncontour.utilities.netcdfhelper import netcdf_to_geojson
+        netcdf_to_geojson(self.ncfile, 'tas')
+        serial = self.pop_geojson_files()
+        self.assertEqual(len(serial), 4)
+        netcdf_to_geojson(self.ncfile, 'tas', workers=3)
+        self.assertEqual(self.geojson_files(), sorted(serial))
+        for filename, expected in serial.items():
+            with open(os.path.join(self.dirname, filename)) as geojson_file:
+                self.assertEqual(geojson_file.read(), expected)
+
+    def test_memory_budget(self):
+        from geojsoncontour.utilities.netcdfhelper import netcdf_to_geojson, setup
+        netcdf_to_geojson(self.ncfile, 'tas')
+        expected = self.pop_geojson_files()
+        # Slabs of three timesteps, the last slab holds only one
+        netcdf_to_geojson(self.ncfile, 'tas', memory_budget=3 * 40 * 60 * 8)
+        self.assertEqual(self.pop_geojson_files(), expected)
+        X, Y, Z, levels, unit = setup(self.ncfile, 'tas', memory_budget=1, meshgrid=False)
+        self.assertEqual(X.shape, (60,))
+        self.assertEqual(Y.shape, (40,))
+        self.assertEqual(levels[0], numpy.nanmin(Z.values))
+        self.assertEqual(levels[-1], numpy.nanmax(Z.values))
+        Z.close()
+
+    def test_worker(self):
+        from geojsoncontour.cli import Worker
+        from geojsoncontour.utilities.netcdfhelper import netcdf_to_geojson
+        netcdf_to_geojson(self.ncfile, 'tas')
+        expected = self.pop_geojson_files()
+        worker = Worker(max_datasets=1)
+        replies = []
+        jobs = [
+            {'id': 1, 'file': self.ncfile, 'variable': 'tas'},
+            {'id': 2, 'file': self.ncfile, 'variable': 'tas', 'timesteps': [0, 3]},
+            {'id': 3, 'file': self.ncfile, 'variable': 'tas', 'timesteps': [0], 'force': True},
+            {'id': 4, 'file': self.ncfile, 'variable': 'pr'},
+            {'id': 5, 'file': self.ncfile, 'variable': 'tas', 'levels': [0, 10, 20],
+             'output': os.path.join(self.dirname, 'fixed_{t}.geojson')},
+        ]
+        worker.serve([json.dumps(job) + '\n' for job in jobs] + ['\n', '[]\n'], replies.append)
+        replies = [json.loads(reply) for reply in replies]
+        self.assertEqual([reply.get('id') for reply in replies], [1, 2, 3, 4, 5, None])
+        self.assertEqual(sorted(os.path.basename(f) for f in replies[0]['written']), sorted(expected))
+        self.assertEqual(replies[0]['skipped'], [])
+        # Up to date files are skipped
+        self.assertEqual(replies[1]['written'], [])
+        self.assertEqual(len(replies[1]['skipped']), 2)
+        self.assertEqual(len(replies[2]['written']), 1)
+        self.assertIn('error', replies[3])
+        self.assertEqual(len(replies[4]['written']), 4)
+        self.assertIn('error', replies[5])
+        with open(os.path.join(self.dirname, 'fixed_0.geojson')) as geojson_file:
+            levels = {feature['properties']['title'] for feature in json.load(geojson_file)['features']}
+        self.assertEqual(levels, {'0.00-10.00 K', '10.00-20.00 K'})
+        path = os.path.realpath(self.ncfile)
+        dataset = worker.dataset(path, os.path.getmtime(path))
+        self.assertIs(worker.dataset(path, os.path.getmtime(path)), dataset)
+        # A modified file is reopened, and the files written before it are converted again
+        self.pop_geojson_files()
+        worker.serve([json.dumps(jobs[0])], replies.append)
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 10))
+        self.assertIsNot(worker.dataset(path, os.path.getmtime(path)), dataset)
+        worker.serve([json.dumps(jobs[0])], replies.append)
+        self.assertEqual(len(json.loads(replies[-1])['written']), 4)
+        self.assertEqual(self.pop_geojson_files(), expected)
+        worker.close()
+
+    def test_worker_failed_timestep(self):
+        import xarray
+        from geojsoncontour.cli import Worker
+        ncfile = os.path.join(self.dirname, 'constant.nc')
+        data = numpy.random.default_rng(0).random((3, 40, 60)).cumsum(axis=2)
+        # A constant timestep has equal levels, which can not be contoured
+        data[1] = 5
+        xarray.Dataset(
+            {'tas': (('time', 'lat', 'lon'), data, {'units': 'K'})},
+            coords={'time': numpy.arange(3), 'lat': numpy.linspace(-10, 10, 40), 'lon': numpy.linspace(0, 30, 60)}
+        ).to_netcdf(ncfile)
+        worker = Worker()
+        replies = []
+        job = json.dumps({'file': ncfile, 'variable': 'tas'})
+        worker.serve([job, job], lambda reply: replies.append(json.loads(reply)))
+        worker.close()
+        self.assertIn('error', replies[0])
+        # The failed timestep left no file, so it is not skipped as up to date
+        self.assertIn('error', replies[1])
+        self.assertEqual(self.geojson_files(), ['constant_tas_t0_0.geojson'])
+        self.assertEqual([f for f in os.listdir(self.dirname) if f.endswith('.tmp')], [])
+
+    def test_worker_socket(self):
+        import socket
+        import threading
+        from geojsoncontour.cli import Worker, serve_unix_socket
+        path = os.path.join(self.dirname, 'worker.sock')
+        thread = threading.Thread(target=serve_unix_socket, args=(Worker(), path), daemon=True)
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            with client.makefile('rw') as stream:
+                stream.write(json.dumps({'id': 'a', 'file': self.ncfile, 'variable': 'tas'}) + '\n')
+                stream.flush()
+                reply = json.loads(stream.readline())
+        self.assertEqual(reply['id'], 'a')
+        self.assertEqual(len(reply['written']), 4)
+        # Only a socket is replaced
+        path = os.path.join(self.dirname, 'regular.sock')
+        with open(path, 'w'):
+            pass
+        with self.assertRaises(FileExistsError):
+            serve_unix_socket(Worker(), path)
+        self.assertTrue(os.path.isfile(path))
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class TestGeoParquet(unittest.TestCase):
+
+    def setUp(self):
+        x = numpy.linspace(-10, 10, 60)
+        y = numpy.linspace(-5, 5, 40)
+        X, Y = numpy.meshgrid(x, y)
+        self.grid = (x, y, numpy.sin(X) * numpy.cos(2 * Y), numpy.linspace(-1, 1, 9))
+
+    @unittest.skipUnless(pyarrow_available(), 'requires pyarrow')
+    def test_geoparquet(self):
+        import pyarrow.parquet
+        for filled in [True, False]:
+            expected = geojsoncontour.array_to_geojson(*self.grid, filled=filled, ndigits=3, serialize=False)
+            result = geojsoncontour.array_to_geojson(*self.grid, filled=filled, ndigits=3,
+                                                     output_format='geoparquet')
+            table = pyarrow.parquet.read_table(io.BytesIO(result))
+            geo = json.loads(table.schema.metadata[b'geo'])
+            geometry_type = expected['features'][0]['geometry']['type']
+            self.assertEqual(geo['columns']['geometry']['geometry_types'], [geometry_type])
+            self.assertEqual(table.schema.field('geometry').metadata[b'ARROW:extension:name'],
+                             f'geoarrow.{geometry_type.lower()}'.encode())
+            self.assertEqual(table.num_rows, len(expected['features']))
+            self.assertEqual(table.column('title').to_pylist(),
+                             [feature['properties']['title'] for feature in expected['features']])
+            for geometry, feature in zip(table.column('geometry').to_pylist(), expected['features']):
+                self.assertEqual(json.loads(json.dumps(geometry)), feature['geometry']['coordinates'])
+        collection = geojsoncontour.array_to_geojson(*self.grid, filled=False, serialize='arrays')
+        self.assertEqual(collection.to_arrow().column('level-value').to_pylist(), collection.properties['level-value'])
+
+    def test_missing_pyarrow(self):
+        with mock.patch.dict('sys.modules', {'pyarrow': None}):
+            with self.assertRaisesRegex(ImportError, 'pip install'):
+                geojsoncontour.array_to_geojson(*self.grid, output_format='geoparquet')
+
+
 class ContourPlotConfig(object):
     def __init__(self, level_lower=0.0, level_upper=100.0, colormap=plt.cm.jet, unit=''):  # jet, jet_r, YlOrRd, gist_rainbow
         self.n_contours = 10